@@ -0,0 +1,147 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#                                      IMPORTS
+# ==============================================================================
+
+import re
+
+
+# ==============================================================================
+#                                   CONSTANTS
+# ==============================================================================
+
+# Keys are written in the scripts as they are : only plain names are accepted
+KEY = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+# ==============================================================================
+#                                     SERVICE
+# ==============================================================================
+
+def quote_key(key):
+    """ Quotes a key to be written in a gremlin script. Values are always
+    bound as parameters, but keys are part of the script : anything but a
+    plain name is rejected, so that a key cannot inject gremlin code.
+
+    :param key: The key, as stored in the database.
+    :type key: str
+    :returns: The quoted key.
+    :rtype: unicode
+    """
+    if not isinstance(key, basestring) or not KEY.match(key):
+        raise Exception('Invalid key : '+repr(key))
+    return u'"'+unicode(key)+u'"'
+
+
+class Predicate(object):
+    """ A condition on the value of a property, beyond plain equality. The
+    value is bound as a parameter of the script : only the key and the operator
+    end up in the gremlin step, so that scripts keep depending on the shape of
+    the query only.
+
+    Operators are :
+    - eq, neq, lt, lte, gt, gte, compiled to has(key, T.op, value),
+    - between, compiled to interval(key, low, high), low being included and
+    high excluded,
+    - in, compiled to has(key, T.in, values), or to one index lookup per value
+    when the query can start from it.
+
+    When no identifier nor indexed equality is given, a comparison on an
+    indexed property starts the query, as g.V.has(key, T.op, value) or
+    g.V.interval(key, low, high), so that the index is queried instead of
+    scanning the elements of the model.
+
+    Predicates are usually built from the attributes of a mapped class :
+    >>> query = repository.filter(Recipe.timeTotal < 30, Recipe.cuisine.in_([u'Thai', u'Indian']))
+    >>> query = repository.filter(Recipe.published.between(monday, friday))
+    """
+
+    OPERATORS = {
+        'eq': u'T.eq',
+        'neq': u'T.neq',
+        'lt': u'T.lt',
+        'lte': u'T.lte',
+        'gt': u'T.gt',
+        'gte': u'T.gte',
+        'in': u'T.in',
+        'between': None
+    }
+
+    def __init__(self, key, operator, value):
+        """ Initializes the predicate.
+
+        :param key: The name of the property.
+        :type key: str
+        :param operator: The comparison, among the keys of OPERATORS.
+        :type operator: str
+        :param value: The value to compare with, a pair of bounds for between, a
+        list of values for in.
+        :type value: mixed
+        """
+        if operator not in self.OPERATORS:
+            raise Exception('Unknown operator : '+str(operator))
+        if operator == 'in':
+            value = list(value)
+        if operator == 'between':
+            value = tuple(value)
+            if len(value) != 2:
+                raise Exception('Between expects two bounds, got '+str(len(value)))
+        self.key = key
+        self.operator = operator
+        self.value = value
+
+
+    def bind(self, convert=None):
+        """ Computes the parameter of the predicate.
+
+        :param convert: Casts each value to its database type, if given.
+        :type convert: callable
+        :returns: The value, or the list of values for between and in.
+        :rtype: mixed
+        """
+        if convert is None:
+            convert = lambda value: value
+        if self.operator in ('in', 'between'):
+            return [convert(value) for value in self.value]
+        return convert(self.value)
+
+
+    @staticmethod
+    def step(key, operator, param):
+        """ Builds the gremlin step filtering on a predicate.
+
+        :param key: The key, as stored in the database.
+        :type key: unicode
+        :param operator: The comparison.
+        :type operator: str
+        :param param: The name of the parameter bound to the value.
+        :type param: unicode
+        :returns: The gremlin step.
+        :rtype: unicode
+        """
+        if operator == 'between':
+            return u'.interval('+quote_key(key)+u', '+param+u'[0], '+param+u'[1])'
+        return u'.has('+quote_key(key)+u', '+Predicate.OPERATORS[operator]+u', '+param+u')'
+
+
+    @staticmethod
+    def lookup(key, param, step=u'V'):
+        """ Builds a gremlin pipe starting from one index lookup per value of an
+        in predicate, all sent within the same request.
+
+        :param key: The indexed key, as stored in the database.
+        :type key: unicode
+        :param param: The name of the parameter bound to the values.
+        :type param: unicode
+        :param step: V for vertices, E for edges.
+        :type step: unicode
+        :returns: The gremlin pipe.
+        :rtype: unicode
+        """
+        return param+u'.collect{ g.'+step+u'('+quote_key(key)+u', it).toList() }.flatten()._()'
+
+
+    def __repr__(self):
+        return '<Predicate('+str(self.key)+' '+self.operator+' '+repr(self.value)+')>'
@@ -13,6 +13,23 @@ from graphalchemy.blueprints.types import Dict
 #                                      MODEL
 # ==============================================================================
 
+class FrozenDict(dict):
+    """ A dictionnary that cannot be modified once built. Lookups are those of
+    a plain dict, but any modification raises : the lookup tables of a model
+    are rebuilt by Model.add_property only, which resets what depends on them.
+    """
+
+    def _immutable(self, *args, **kwargs):
+        raise Exception('Cannot modify the properties of a model : use add_property.')
+
+    __setitem__ = __delitem__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self),))
+
+
+
 class Model(object):
     """ Holds all the schema characteristics that we want to enforce on an
     Element (a Vertex or an Edge).
@@ -28,8 +45,17 @@ class Model(object):
     def __init__(self, model_name, metadata, *args, **kwargs):
         self.model_name = model_name
         self.metadata = metadata
-        self._properties = {}
+        # Lookup tables of the properties, by name in Python, by name in the
+        # database, and in order of declaration
+        self._properties = FrozenDict()
+        self._properties_db = FrozenDict()
+        self._properties_ordered = ()
+        # Properties whose values can change in place
+        self._properties_mutable = ()
         self._adjacencies = {}
+        # Mapping functions generated for each mapped class
+        self._hydrators = {}
+        self._dehydrators = {}
         self.indices = {}
         self.logger = kwargs.get('logger', None)
 
@@ -62,7 +88,8 @@ class Model(object):
 
     def add_property(self, prop):
         """ Registers a property on the current model, and register its index
-        if it exists.
+        if it exists. The lookup tables of the properties are rebuilt, so that
+        mapping an element never has to scan the properties.
 
         :param prop: The property to register.
         :type prop: graphalchemy.blueprints.schema.Property
@@ -71,12 +98,26 @@ class Model(object):
         """
         if prop.name_py in self._properties:
             raise Exception('Cannot override previously set property.')
-        self._properties[prop.name_py] = prop
+        name_db = prop.name_db
+        if prop.prefix == True:
+            name_db = self.model_name + '_' + name_db
+        if name_db in self._properties_db:
+            raise Exception('Cannot map two properties to '+str(name_db))
         if prop.index:
             self.indices[prop.name_py] = prop
-        if prop.prefix == True:
-            prop.name_db = self.model_name + '_' + prop.name_db
+        prop.name_db = name_db
         prop.model = self
+        properties = dict(self._properties)
+        properties[prop.name_py] = prop
+        self._properties = FrozenDict(properties)
+        properties_db = dict(self._properties_db)
+        properties_db[prop.name_db] = prop
+        self._properties_db = FrozenDict(properties_db)
+        self._properties_ordered = self._properties_ordered + (prop,)
+        if prop.mutable:
+            self._properties_mutable = self._properties_mutable + (prop,)
+        self._hydrators = {}
+        self._dehydrators = {}
         return self
 
 
@@ -368,8 +409,10 @@ class Property(object):
         if isinstance(self.type, List) \
         or isinstance(self.type, Dict):
             self.unique_node = True
+            self.mutable = True
         else:
             self.unique_node = False
+            self.mutable = False
 
         self.index = index
 
@@ -459,14 +502,21 @@ class MetaData(object):
         raise Exception('Unmapped class.')
 
     def for_model(self, model):
-        for class_, node_model in self._nodes:
+        for class_, node_model in self._nodes.iteritems():
             if model is node_model:
                 return class_
-        for class_, relationship_model in self._relationships:
+        for class_, relationship_model in self._relationships.iteritems():
             if model is relationship_model:
                 return class_
         raise Exception('Unmapped model.')
 
+    def for_model_name(self, model_name, node=True):
+        models = self._nodes if node else self._relationships
+        for model in models.itervalues():
+            if model.model_name == model_name:
+                return model
+        raise Exception('Unmapped model : '+str(model_name))
+
     def bind_node(self, class_, model):
         if not model.is_node():
             raise Exception('Bound model is not a node !')
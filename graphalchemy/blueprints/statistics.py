@@ -0,0 +1,156 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#                                      IMPORTS
+# ==============================================================================
+
+from graphalchemy.blueprints.types import Boolean
+
+
+# ==============================================================================
+#                                     SERVICE
+# ==============================================================================
+
+class IndexStatistics(object):
+    """ Holds the selectivity of the indexed keys of each model, in order to
+    start queries from the index that matches the fewest elements.
+
+    The selectivity of a key is the ratio of distinct values among the elements
+    of the model : 1.0 for a unique key, close to 0.0 for a boolean flag. It is
+    either configured, or sampled from the database. Otherwise, it is guessed
+    from the property : unique properties are the most selective, booleans the
+    least.
+
+    Example use :
+    >>> statistics = IndexStatistics()
+    >>> statistics.set('Page', 'url', 1.0)
+    >>> statistics.sample(client, page, 'accessible')
+    >>> statistics.most_selective('Page', ['accessible', 'url'])
+    'url'
+    """
+
+    # The selectivity of a key that nothing is known about
+    DEFAULT_SELECTIVITY = 0.5
+
+    SAMPLE = u'g.V(model_key, model_name).range(0, high).transform{ it.getProperty(key) }'
+
+    def __init__(self, logger=None):
+        """ Initializes empty statistics.
+
+        :param logger: An optionnal logger.
+        :type logger: logging.Logger
+        """
+        self._selectivities = {}
+        self.logger = logger
+
+
+    def set(self, model_name, key, selectivity):
+        """ Configures the selectivity of a key.
+
+        :param model_name: The name of the model.
+        :type model_name: str
+        :param key: The key, as stored in the database.
+        :type key: str
+        :param selectivity: The ratio of distinct values, between 0 and 1.
+        :type selectivity: float
+        :returns: This object itself.
+        :rtype: graphalchemy.blueprints.statistics.IndexStatistics
+        """
+        if selectivity < 0 or selectivity > 1:
+            raise Exception('Selectivity must be between 0 and 1, got '+str(selectivity))
+        self._selectivities[(model_name, key)] = float(selectivity)
+        return self
+
+
+    def get(self, model_name, key, property=None):
+        """ :returns: The selectivity of a key, configured, sampled or guessed
+        from its property.
+        :rtype: float
+        """
+        selectivity = self._selectivities.get((model_name, key), None)
+        if selectivity is not None:
+            return selectivity
+        if property is not None:
+            if property.unique_graph:
+                return 1.0
+            if isinstance(property.type, Boolean):
+                return 0.0
+        return self.DEFAULT_SELECTIVITY
+
+
+    def sample(self, client, model, key, size=1000):
+        """ Measures the selectivity of a key on a sample of the elements of a
+        node model.
+
+        :param client: The client to send the sampling script through.
+        :type client: bulbs.rexster.client.RexsterClient
+        :param model: The node model.
+        :type model: graphalchemy.blueprints.schema.Node
+        :param key: The key, as stored in the database.
+        :type key: str
+        :param size: The number of elements to sample.
+        :type size: int
+        :returns: The measured selectivity, or None if no element has the key.
+        :rtype: float
+        """
+        params = {
+            'model_key': model.model_name_storage_key,
+            'model_name': model.model_name,
+            'key': key,
+            'high': size - 1
+        }
+        self._log(self.SAMPLE+u', '+unicode(params))
+        values = client.gremlin(self.SAMPLE, params).content['results'] or []
+        values = [value for value in values if value is not None]
+        if not len(values):
+            return None
+        selectivity = len(set(values)) / float(len(values))
+        self.set(model.model_name, key, selectivity)
+        return selectivity
+
+
+    def most_selective(self, model_name, keys, properties=None):
+        """ Picks the most selective key, ties being broken by key order.
+
+        :param model_name: The name of the model.
+        :type model_name: str
+        :param keys: The candidate keys, as stored in the database.
+        :type keys: list
+        :param properties: The properties of the keys, if known.
+        :type properties: dict
+        :returns: The most selective key, or None if there is no candidate.
+        :rtype: str
+        """
+        return (self.rank(model_name, keys, properties) or [None])[0]
+
+
+    def rank(self, model_name, keys, properties=None):
+        """ Sorts keys from the most selective to the least selective one.
+
+        :param model_name: The name of the model.
+        :type model_name: str
+        :param keys: The candidate keys, as stored in the database.
+        :type keys: list
+        :param properties: The properties of the keys, if known.
+        :type properties: dict
+        :returns: The sorted keys.
+        :rtype: list
+        """
+        properties = properties or {}
+        return sorted(keys, key=lambda key: (-self.get(model_name, key, properties.get(key, None)), key))
+
+
+    def _log(self, message, level=10):
+        """ Thin wrapper for logging purposes.
+
+        :param message: The message to log.
+        :type message: str
+        :param level: The level of the log.
+        :type level: int
+        :returns: This object itself.
+        :rtype: graphalchemy.blueprints.statistics.IndexStatistics
+        """
+        if self.logger is not None:
+            self.logger.log(level, message)
+        return self
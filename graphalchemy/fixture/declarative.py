@@ -37,6 +37,8 @@ class WebsiteHostsPage(Base):
         self.label = 'hosts'
         self.since = None
         self.accessible = None
+        self.outV = None
+        self.inV = None
         super(WebsiteHostsPage, self).__init__(*args, **kwargs)
 
 
@@ -66,16 +68,16 @@ page = Node('Page', metadata,
 )
 
 websiteHostsPageZ = Relationship('hosts', metadata,
-    Property('since', DateTime, nullable=False),
+    Property('since', DateTime(), nullable=False),
     Property('accessible', Boolean())
 )
 
-websiteHostsPage_out = Adjacency(website,
+websiteHostsPage_out = Adjacency(websiteHostsPageZ,
     direction=Relationship.OUT,
     unique=False,
     nullable=True
 )
-websiteHostsPage_in = Adjacency(page,
+websiteHostsPage_in = Adjacency(websiteHostsPageZ,
     direction=Relationship.IN,
     unique=True,
     nullable=False
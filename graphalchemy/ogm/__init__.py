@@ -7,13 +7,17 @@
 
 from graphalchemy.repository import BulbsNodeRepository
 from graphalchemy.repository import BulbsRelationshipRepository
+from graphalchemy.ogm.bulk import BulkWriter
+from graphalchemy.blueprints.statistics import IndexStatistics
 
 # Bulbs
 from bulbs.model import Node
 from bulbs.model import Relationship
+from bulbs.rexster.client import RexsterResult
 
 # System
 import importlib
+from collections import OrderedDict
 
 
 # ==============================================================================
@@ -75,10 +79,18 @@ class BulbsObjectManager(object):
         self.client = TitanClient(db_name=database)
         from bulbs.titan import Graph
         self.graph = Graph(self.client.config)
+        self.writer = BulkWriter(self.client, logger=logger)
         
-        # Init identity map
-        self.session_delete = []
-        self.session_add = []
+        # Selectivity of the indices, shared by the repositories
+        self.statistics = IndexStatistics(logger=logger)
+        
+        # Number of elements actually removed by the last flush
+        self.last_deleted_count = 0
+        
+        # Init identity map : entities are keyed by identity, in insertion 
+        # order
+        self.session_delete = OrderedDict()
+        self.session_add = OrderedDict()
         self._repositorys = {}
         self.model_paths = model_paths
 
@@ -115,7 +127,8 @@ class BulbsObjectManager(object):
                 model, 
                 self.client, 
                 graph=self.graph, 
-                logger=self.logger
+                logger=self.logger,
+                statistics=self.statistics
             )
         elif issubclass(model, Relationship):
             self.graph.add_proxy(repository_name, model)
@@ -139,18 +152,10 @@ class BulbsObjectManager(object):
         :type entity: bulbs.model.Node, bulbs.model.Relationship
         :returns: graphalchemy.ogm.BulbsObjectManager -- this object itself.
         """
-        found = False
-        for entity_add in self.session_add:
-            if entity_add is entity:
-                found = True
-                break
-        if not found:
-            self.session_add.append(entity)
-        
-        for entity_delete in self.session_delete:
-            if entity_delete is entity:
-                self.session_delete.remove(entity)
-                break
+        key = id(entity)
+        if key not in self.session_add:
+            self.session_add[key] = entity
+        self.session_delete.pop(key, None)
         return self
 
 
@@ -161,16 +166,10 @@ class BulbsObjectManager(object):
         :type entity: bulbs.model.Node, bulbs.model.Relationship
         :returns: graphalchemy.ogm.BulbsObjectManager -- this object itself.
         """
-        found = False
-        for entity_delete in self.session_delete:
-            if entity is entity_delete:
-                found = True
-                break
-        if not found:
-            self.session_add.append(entity)
-        for entity_add in self.session_add:
-            if entity is entity_add:
-                self.session_add.remove(entity)
+        key = id(entity)
+        if key not in self.session_delete:
+            self.session_delete[key] = entity
+        self.session_add.pop(key, None)
         return self
 
 
@@ -190,32 +189,39 @@ class BulbsObjectManager(object):
         """
         
         # We need to save nodes first
-        for entity in self.session_add:
+        for entity in self.session_add.itervalues():
             if isinstance(entity, Node):
                 self._log("Flushed "+str(entity))
                 self._flush_one_node(entity)
-        for entity in self.session_add:
+        # Relationships created from scratch are sent in batches
+        relations = []
+        for entity in self.session_add.itervalues():
             if isinstance(entity, Relationship):
+                if entity._client is None:
+                    relations.append(entity)
+                    continue
                 self._log("Flushed "+str(entity))
-                self._flush_one_relation(entity)
+                entity.save()
+        self._flush_new_relations(relations)
         # Do not reset the session, we keep them tracked            
         # self.session_add = []
         
-        # We need to delete nodes first
-        for entity in self.session_delete:
+        # We need to delete relations first : they are grouped by type, and 
+        # removed with a few batched requests
+        edge_eids = []
+        vertex_eids = []
+        for entity in self.session_delete.itervalues():
             if entity._client is None:
                 continue
+            self._log("Deleted "+str(entity))
             if isinstance(entity, Relationship):
-                self._log("Deleted "+str(entity))
-                entity._edges.delete(entity.eid)
-        for entity in self.session_delete:
-            if entity._client is None:
-                continue
-            if isinstance(entity, Node):
-                self._log("Deleted "+str(entity))
-                entity._vertices.delete(entity.eid)
+                edge_eids.append(entity.eid)
+            elif isinstance(entity, Node):
+                vertex_eids.append(entity.eid)
+        self.last_deleted_count = self.writer.delete(edge_eids, vertex_eids)
+        self._log("Deleted "+str(self.last_deleted_count)+" elements")
         # All deleted entities are detached
-        self.session_delete = []
+        self.session_delete = OrderedDict()
         
         return self
     
@@ -233,35 +239,62 @@ class BulbsObjectManager(object):
         return self
     
             
-    def _flush_one_relation(self, entity):
-        # Regular case, the entity is either loaded or created via repository
-        if entity._client is not None:
-            entity.save()
-            return self
-            
-        # Case where the entity was created from scratch (our hack)
-        entity._client = self.graph.client
+    def _flush_new_relations(self, entities):
+        """ Creates the given relationships with a few batched requests. At 
+        this point, all Nodes are supposed to have been persisted, so we can 
+        retrieve the eids of the endpoints.
         
-        # At this point, all Nodes are supposed to have been persisted, so we 
-        # can retrieve their eid.
-        if entity._outV_vertex is None:
-            raise Exception('Outbound Vertex not set')
-
-        if entity._inV_vertex is None:
-            raise Exception('Inbound Vertex not set')
-
-        entity._create(
-            entity._outV_vertex,
-            entity._inV_vertex,
-            entity._get_property_data(), 
-            {}
-        )
+        :param entities: The relationships created from scratch (our hack).
+        :type entities: list<graphalchemy.model.Relationship>
+        :returns: graphalchemy.ogm.BulbsObjectManager -- this object itself.
+        """
+        if not len(entities):
+            return self
         
-        entity._outV_vertex = None
-        entity._inV_vertex = None
+        edges = []
+        for entity in entities:
+            if entity._outV_vertex is None:
+                raise Exception('Outbound Vertex not set')
+            if entity._inV_vertex is None:
+                raise Exception('Inbound Vertex not set')
+            entity._client = self.graph.client
+            edges.append({
+                'outV': self._get_eid(entity._outV_vertex),
+                'inV': self._get_eid(entity._inV_vertex),
+                'label': entity.get_label(self.client.config),
+                'data': entity._get_property_data()
+            })
+        eids = self.writer.create_edges(edges)
+        
+        # Initialize the entities as if they were returned by the database
+        for entity, edge, eid in zip(entities, edges, eids):
+            result = dict((key, value) for key, value in edge['data'].iteritems() if value is not None)
+            result.update({
+                '_id': eid,
+                '_type': 'edge',
+                '_outV': edge['outV'],
+                '_inV': edge['inV'],
+                '_label': edge['label']
+            })
+            entity._initialize(RexsterResult(result, self.client.config))
+            entity._outV_vertex = None
+            entity._inV_vertex = None
+            self._log("Flushed "+str(entity))
         
         return self
     
+    
+    def _get_eid(self, vertex):
+        """ Returns the eid of a vertex, given as an element or as an eid.
+        
+        :param vertex: The vertex.
+        :type vertex: bulbs.model.Node, int
+        :returns: int -- The eid of the vertex.
+        """
+        if isinstance(vertex, (int, long, basestring)):
+            return vertex
+        return vertex.eid
+    
             
     def query(self, gremlin, params):
         """ Performs a gremlin query against the database.
@@ -304,8 +337,8 @@ class BulbsObjectManager(object):
         :type entity: bulbs.model.Node, bulbs.model.Relationship
         :returns: graphalchemy.ogm.BulbsObjectManager -- this object itself.
         """
-        self.session_add = []
-        self.session_delete = []
+        self.session_add = OrderedDict()
+        self.session_delete = OrderedDict()
         return self
         
             
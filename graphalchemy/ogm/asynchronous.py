@@ -0,0 +1,229 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#                                      IMPORTS
+# ==============================================================================
+
+from multiprocessing.pool import ThreadPool
+import threading
+
+from graphalchemy.ogm.session import Session
+
+
+# ==============================================================================
+#                                     SERVICE
+# ==============================================================================
+
+class AsyncSession(Session):
+    """ A session whose flushes and queries run in the background, on a pool of
+    threads, so that the calling thread is never blocked by the database.
+
+    Each call returns a future, a multiprocessing.pool.AsyncResult, whose get()
+    method waits for the outcome and re-raises any error. At most concurrency
+    requests run at the same time. The HTTP connection of a client cannot be
+    shared between threads, so each thread of the pool gets its own client,
+    built by client_factory.
+
+    Queries only fetch their rows in the background : the rows are mapped to
+    objects when get() is called, on the calling thread, so that the threads
+    of the pool never modify the identity map. Mappings, flushes and the
+    changes of the session are serialized by a lock : adding or deleting an
+    object while a flush runs waits for the flush to complete.
+
+    Example use :
+    >>> session = AsyncSession(client, metadata, concurrency=8)
+    >>> session.add(website)
+    >>> flushed = session.flush_async()
+    >>> pages = session.all_async(page_query)
+    >>> flushed.get()
+    >>> for page in pages.get():
+    ...     print page.title
+    """
+
+    def __init__(self, client, metadata, concurrency=4, client_factory=None, **kwargs):
+        """ Initializes the session.
+
+        :param client: The client used by the calling thread.
+        :type client: bulbs.rexster.client.RexsterClient
+        :param metadata: The metadata of the mapped classes.
+        :type metadata: graphalchemy.blueprints.schema.MetaData
+        :param concurrency: The maximum number of requests sent concurrently.
+        :type concurrency: int
+        :param client_factory: Builds a new client, for each thread of the pool.
+        Defaults to a client of the same class, sharing the same config.
+        :type client_factory: callable
+        """
+        if concurrency < 1:
+            raise Exception('Concurrency must be strictly positive.')
+        self._local = threading.local()
+        self._identity_lock = threading.RLock()
+        super(AsyncSession, self).__init__(client, metadata, client_factory=client_factory, **kwargs)
+        self.concurrency = concurrency
+        self.pool = ThreadPool(concurrency)
+
+
+    def add(self, instance):
+        with self._identity_lock:
+            return super(AsyncSession, self).add(instance)
+
+
+    def delete(self, instance):
+        with self._identity_lock:
+            return super(AsyncSession, self).delete(instance)
+
+
+    def clear(self):
+        with self._identity_lock:
+            return super(AsyncSession, self).clear()
+
+
+    def flush(self, batch_size=None, workers=None):
+        with self._identity_lock:
+            return super(AsyncSession, self).flush(batch_size, workers)
+
+
+    @property
+    def client(self):
+        """ :returns: The client of the current thread.
+        :rtype: bulbs.rexster.client.RexsterClient
+        """
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.client_factory()
+        return client
+
+
+    @client.setter
+    def client(self, client):
+        self._local.client = client
+
+
+    def submit(self, func, *args, **kwargs):
+        """ Runs a function on the pool.
+
+        :param func: The function to run.
+        :type func: callable
+        :returns: The future result of the function.
+        :rtype: multiprocessing.pool.AsyncResult
+        """
+        return self.pool.apply_async(func, args, kwargs)
+
+
+    def flush_async(self, batch_size=None, workers=None):
+        """ Flushes the session in the background. Flushes never overlap each
+        other.
+
+        :param batch_size: The maximum number of objects per unit of work.
+        :type batch_size: int
+        :param workers: The number of threads the flush itself is split on, on
+        top of the concurrency of the session.
+        :type workers: int
+        :returns: The future session, once flushed.
+        :rtype: multiprocessing.pool.AsyncResult
+        """
+        return self.submit(self.flush, batch_size, workers)
+
+
+    def all_async(self, query):
+        """ Runs a query in the background.
+
+        :param query: The query to run.
+        :type query: graphalchemy.ogm.query.Query
+        :returns: The future list of results.
+        :rtype: graphalchemy.ogm.asynchronous.QueryResult
+        """
+        def load(rows):
+            return query._load_all(rows, query._track)
+        return QueryResult(self.submit(query._fetch), load, self._identity_lock)
+
+
+    def first_async(self, query):
+        """ Runs a query in the background, for its first result only.
+
+        :param query: The query to run.
+        :type query: graphalchemy.ogm.query.Query
+        :returns: The future first result, or None.
+        :rtype: graphalchemy.ogm.asynchronous.QueryResult
+        """
+        head = query._head(1)
+        def load(rows):
+            objs = head._load_all(rows, head._track)
+            return objs[0] if len(objs) else None
+        return QueryResult(self.submit(head._fetch), load, self._identity_lock)
+
+
+    def gather(self, futures, timeout=None):
+        """ Waits for several futures.
+
+        :param futures: The futures to wait for.
+        :type futures: list<multiprocessing.pool.AsyncResult|graphalchemy.ogm.asynchronous.QueryResult>
+        :param timeout: The maximum number of seconds to wait for each future.
+        :type timeout: float
+        :returns: The results, in the same order.
+        :rtype: list
+        """
+        return [future.get(timeout) for future in futures]
+
+
+    def close(self):
+        """ Waits for the pending work, then stops the threads of the pool.
+
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.asynchronous.AsyncSession
+        """
+        self.pool.close()
+        self.pool.join()
+        return self
+
+
+
+class QueryResult(object):
+    """ The future result of a query run in the background. It behaves as a
+    multiprocessing.pool.AsyncResult, except that the rows fetched by the pool
+    are mapped to objects by the first call to get(), on the calling thread.
+    """
+
+    def __init__(self, future, load, lock):
+        """ Initializes the result.
+
+        :param future: The future rows, as fetched by the pool.
+        :type future: multiprocessing.pool.AsyncResult
+        :param load: Maps the rows to the result.
+        :type load: callable
+        :param lock: Serializes the modifications of the identity map.
+        :type lock: threading.RLock
+        """
+        self._future = future
+        self._load = load
+        self._lock = lock
+        self._loaded = False
+        self._value = None
+
+
+    def get(self, timeout=None):
+        """ Waits for the rows, and maps them on first call.
+
+        :param timeout: The maximum number of seconds to wait.
+        :type timeout: float
+        :returns: The result of the query.
+        :rtype: mixed
+        """
+        rows = self._future.get(timeout)
+        with self._lock:
+            if not self._loaded:
+                self._value = self._load(rows)
+                self._loaded = True
+        return self._value
+
+
+    def wait(self, timeout=None):
+        self._future.wait(timeout)
+
+
+    def ready(self):
+        return self._future.ready()
+
+
+    def successful(self):
+        return self._future.successful()
@@ -0,0 +1,159 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#                                      IMPORTS
+# ==============================================================================
+
+from graphalchemy.blueprints.predicates import Predicate
+
+# ==============================================================================
+#                                   CONSTANTS
+# ==============================================================================
+
+# The key under which an object references its state in its own __dict__
+STATE_KEY = '_graphalchemy_state'
+
+# Marker for attributes that have no class-level default value
+NO_VALUE = object()
+
+
+# ==============================================================================
+#                                 INSTRUMENTATION
+# ==============================================================================
+
+class InstrumentedAttribute(object):
+    """ Descriptor installed by the mapper on each mapped property of a class.
+
+    Values are stored in the instance __dict__ as usual, so the object behaves
+    like a plain Python object. Each assignment is recorded in the state of the
+    object if it is tracked by an identity map, so that a flush only visits the
+    objects and properties that actually changed.
+
+    Example use :
+    >>> page = Page(title='Foo')
+    >>> session.add(page)
+    >>> session.flush()
+    >>> page.title = 'Bar'
+    >>> instance_state(page).modified
+    set(['title'])
+
+    On the class, comparing the descriptor builds a predicate to filter
+    queries with :
+    >>> query = repository.filter(Recipe.timeTotal < 30)
+    >>> query = repository.filter(Recipe.cuisine.in_([u'Thai', u'Indian']))
+    """
+
+    def __init__(self, key, default=NO_VALUE):
+        """ Initializes the descriptor.
+
+        :param key: The name of the attribute in Python.
+        :type key: str
+        :param default: The class-level value that was overriden by the
+        descriptor, if any.
+        :type default: mixed
+        """
+        self.key = key
+        self.default = default
+
+
+    def __get__(self, obj, class_):
+        if obj is None:
+            return self
+        try:
+            return obj.__dict__[self.key]
+        except KeyError:
+            if self.default is NO_VALUE:
+                raise AttributeError(self.key)
+            return self.default
+
+
+    def __set__(self, obj, value):
+        obj.__dict__[self.key] = value
+        state = obj.__dict__.get(STATE_KEY, None)
+        if state is not None:
+            state.modify(self.key)
+
+
+    def __delete__(self, obj):
+        try:
+            del obj.__dict__[self.key]
+        except KeyError:
+            raise AttributeError(self.key)
+        state = obj.__dict__.get(STATE_KEY, None)
+        if state is not None:
+            state.modify(self.key)
+
+
+    def __eq__(self, value):
+        return Predicate(self.key, 'eq', value)
+
+
+    def __ne__(self, value):
+        return Predicate(self.key, 'neq', value)
+
+
+    def __lt__(self, value):
+        return Predicate(self.key, 'lt', value)
+
+
+    def __le__(self, value):
+        return Predicate(self.key, 'lte', value)
+
+
+    def __gt__(self, value):
+        return Predicate(self.key, 'gt', value)
+
+
+    def __ge__(self, value):
+        return Predicate(self.key, 'gte', value)
+
+
+    # Comparisons must not make descriptors unhashable
+    __hash__ = object.__hash__
+
+
+    def between(self, low, high):
+        """ :returns: A predicate matching the values from low included to high
+        excluded.
+        :rtype: graphalchemy.blueprints.predicates.Predicate
+        """
+        return Predicate(self.key, 'between', (low, high))
+
+
+    def in_(self, values):
+        """ :returns: A predicate matching any of the given values.
+        :rtype: graphalchemy.blueprints.predicates.Predicate
+        """
+        return Predicate(self.key, 'in', values)
+
+
+    def __repr__(self):
+        return '<InstrumentedAttribute('+self.key+')>'
+
+
+
+def instrument(class_, key):
+    """ Installs an InstrumentedAttribute on a class, keeping the class-level
+    value it replaces as the default value.
+
+    :param class_: The mapped class.
+    :type class_: object
+    :param key: The name of the attribute in Python.
+    :type key: str
+    :returns: The installed descriptor.
+    :rtype: graphalchemy.ogm.attributes.InstrumentedAttribute
+    """
+    default = class_.__dict__.get(key, NO_VALUE)
+    if isinstance(default, InstrumentedAttribute):
+        return default
+    attribute = InstrumentedAttribute(key, default)
+    setattr(class_, key, attribute)
+    return attribute
+
+
+def instance_state(obj):
+    """ :returns: The state of an object tracked by an identity map, or None.
+    :rtype: graphalchemy.ogm.state.InstanceState
+    """
+    return getattr(obj, '__dict__', {}).get(STATE_KEY, None)
@@ -0,0 +1,216 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#                                      IMPORTS
+# ==============================================================================
+
+
+# ==============================================================================
+#                                     SERVICE
+# ==============================================================================
+
+class BulkWriter(object):
+    """ Sends element writes to the database in batches. Each chunk of elements
+    is persisted by a single parameterized Gremlin script, so that flushing N
+    elements costs N / chunk_size round trips instead of N.
+
+    The script text does not depend on the data, which is only bound through
+    the parameters.
+
+    Example use :
+    >>> writer = BulkWriter(client, chunk_size=500)
+    >>> ids = writer.create_vertices([{'name': 'AllRecipes'}, {'name': 'FoodNetwork'}])
+    """
+
+    # The default number of elements sent per request
+    CHUNK_SIZE = 500
+
+    CREATE_VERTICES = u'datas.collect{ g.addVertex(null, it).id }'
+    CREATE_EDGES = u'edges.collect{ g.addEdge(null, g.v(it.outV), g.v(it.inV), it.label, it.data).id }'
+    DELETE = u'n = 0; '\
+        u'eids.each{ e = g.e(it); if (e != null) { g.removeEdge(e); n++ } }; '\
+        u'vids.each{ v = g.v(it); if (v != null) { g.removeVertex(v); n++ } }; '\
+        u'n'
+
+    def __init__(self, client, chunk_size=None, logger=None):
+        """ Initializes the writer.
+
+        :param client: The client to send the scripts through.
+        :type client: bulbs.rexster.client.RexsterClient
+        :param chunk_size: The maximum number of elements per request.
+        :type chunk_size: int
+        :param logger: An optionnal logger.
+        :type logger: logging.Logger
+        """
+        self.client = client
+        if chunk_size is None:
+            chunk_size = self.CHUNK_SIZE
+        if chunk_size < 1:
+            raise Exception('Chunk size must be strictly positive.')
+        self.chunk_size = chunk_size
+        self.logger = logger
+
+
+    def create_vertices(self, datas):
+        """ Creates one vertex per property dictionnary.
+
+        :param datas: The properties of the vertices to create, as they must be
+        stored in the database.
+        :type datas: list<dict>
+        :returns: The identifiers of the created vertices, in the same order as
+        the given data.
+        :rtype: list
+        """
+        ids = []
+        for script, params in self.vertex_requests(datas):
+            ids.extend(self._run(script, params))
+        if len(ids) != len(datas):
+            raise Exception('Expected '+str(len(datas))+' identifiers, got '+str(len(ids)))
+        return ids
+
+
+    def create_edges(self, edges):
+        """ Creates one edge per description. The endpoints must have been
+        persisted before, as they are given by their identifiers.
+
+        :param edges: The edges to create, each being described by a dictionnary
+        with the keys outV, inV (the endpoint ids), label and data (the
+        properties, as they must be stored in the database).
+        :type edges: list<dict>
+        :returns: The identifiers of the created edges, in the same order as
+        the given descriptions.
+        :rtype: list
+        """
+        ids = []
+        for script, params in self.edge_requests(edges):
+            ids.extend(self._run(script, params))
+        if len(ids) != len(edges):
+            raise Exception('Expected '+str(len(edges))+' identifiers, got '+str(len(ids)))
+        return ids
+
+
+    def delete(self, edge_ids, vertex_ids):
+        """ Removes elements by id : edges first, then vertices. Each chunk
+        is removed by a single request, whatever the mix of edges and vertices
+        it holds.
+
+        :param edge_ids: The ids of the edges to remove.
+        :type edge_ids: list
+        :param vertex_ids: The ids of the vertices to remove.
+        :type vertex_ids: list
+        :returns: The number of elements that were actually removed, the other
+        ones being already missing from the database.
+        :rtype: int
+        """
+        removed = 0
+        for script, params in self.delete_requests(edge_ids, vertex_ids):
+            results = self._run(script, params)
+            if len(results):
+                removed += int(results[0])
+        return removed
+
+
+    def vertex_requests(self, datas):
+        """ Builds the requests that create_vertices sends, without sending them.
+
+        :param datas: The properties of the vertices to create.
+        :type datas: list<dict>
+        :returns: The script and parameter bindings of each request.
+        :rtype: generator
+        """
+        for chunk in self._chunks(datas):
+            yield self.CREATE_VERTICES, {'datas': [self._clean(data) for data in chunk]}
+
+
+    def edge_requests(self, edges):
+        """ Builds the requests that create_edges sends, without sending them.
+
+        :param edges: The descriptions of the edges to create.
+        :type edges: list<dict>
+        :returns: The script and parameter bindings of each request.
+        :rtype: generator
+        """
+        for chunk in self._chunks(edges):
+            yield self.CREATE_EDGES, {'edges': [{
+                'outV': edge['outV'],
+                'inV': edge['inV'],
+                'label': edge['label'],
+                'data': self._clean(edge['data'])
+            } for edge in chunk]}
+
+
+    def delete_requests(self, edge_ids, vertex_ids):
+        """ Builds the requests that delete sends, without sending them.
+
+        :param edge_ids: The ids of the edges to remove.
+        :type edge_ids: list
+        :param vertex_ids: The ids of the vertices to remove.
+        :type vertex_ids: list
+        :returns: The script and parameter bindings of each request.
+        :rtype: generator
+        """
+        elements = [('edge', id) for id in edge_ids] \
+                 + [('vertex', id) for id in vertex_ids]
+        for chunk in self._chunks(elements):
+            yield self.DELETE, {
+                'eids': [id for type_, id in chunk if type_ == 'edge'],
+                'vids': [id for type_, id in chunk if type_ == 'vertex']
+            }
+
+
+    def _run(self, script, params):
+        """ Executes a script and returns its raw results.
+
+        :param script: The gremlin script.
+        :type script: unicode
+        :param params: The parameter bindings of the script.
+        :type params: dict
+        :returns: The raw results of the script.
+        :rtype: list
+        """
+        self._log(script)
+        response = self.client.gremlin(script, params)
+        results = response.content['results']
+        if results is None:
+            return []
+        return results
+
+
+    def _chunks(self, items):
+        """ Splits a list of items in chunks of at most chunk_size items.
+
+        :param items: The items to split.
+        :type items: list
+        :returns: The successive chunks.
+        :rtype: generator
+        """
+        for start in xrange(0, len(items), self.chunk_size):
+            yield items[start:start+self.chunk_size]
+
+
+    def _clean(self, data):
+        """ Removes the null values, which the database does not accept as
+        property values.
+
+        :param data: The properties of an element.
+        :type data: dict
+        :returns: The properties without the null values.
+        :rtype: dict
+        """
+        return dict((key, value) for key, value in data.iteritems() if value is not None)
+
+
+    def _log(self, message, level=10):
+        """ Thin wrapper for logging purposes.
+
+        :param message: The message to log.
+        :type message: str
+        :param level: The level of the log.
+        :type level: int
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.bulk.BulkWriter
+        """
+        if self.logger is not None:
+            self.logger.log(level, message)
+        return self
@@ -0,0 +1,201 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#                                      IMPORTS
+# ==============================================================================
+
+import re
+
+from graphalchemy.blueprints.schema import Property
+from graphalchemy.blueprints.types import Type
+from graphalchemy.blueprints.types import Integer
+from graphalchemy.blueprints.types import Float
+from graphalchemy.blueprints.types import Boolean
+from graphalchemy.blueprints.types import String
+from graphalchemy.ogm.attributes import InstrumentedAttribute
+from graphalchemy.ogm.attributes import NO_VALUE
+
+
+# ==============================================================================
+#                                   CONSTANTS
+# ==============================================================================
+
+# Conversions that can be inlined, by method : None stands for the identity
+INLINED = {
+    Type.to_py.__func__: None,
+    Type.to_db.__func__: None,
+    Integer.to_py.__func__: 'int',
+    Float.to_py.__func__: 'float',
+    Boolean.to_py.__func__: 'bool',
+    String.to_py.__func__: 'unicode',
+}
+
+IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+# ==============================================================================
+#                                 CODE GENERATION
+# ==============================================================================
+
+def hydrator(model, class_):
+    """ Returns the function that maps an element of a model to an instance of
+    a class, generating it on first use.
+
+    :param model: The model of the elements.
+    :type model: graphalchemy.blueprints.schema.Model
+    :param class_: The mapped class.
+    :type class_: object
+    :returns: A function taking an element as returned by the database, and
+    returning the new object along with the values it was built from.
+    :rtype: callable
+    """
+    hydrate = model._hydrators.get(class_, None)
+    if hydrate is None:
+        hydrate = model._hydrators[class_] = compile_hydrator(model, class_)
+    return hydrate
+
+
+def dehydrator(model, class_):
+    """ Returns the function that computes the values to store for an instance
+    of a class, generating it on first use.
+
+    :param model: The model of the instances.
+    :type model: graphalchemy.blueprints.schema.Model
+    :param class_: The mapped class.
+    :type class_: object
+    :returns: A function taking an object, and returning its values as they
+    must be stored in the database.
+    :rtype: callable
+    """
+    dehydrate = model._dehydrators.get(class_, None)
+    if dehydrate is None:
+        dehydrate = model._dehydrators[class_] = compile_dehydrator(model, class_)
+    return dehydrate
+
+
+def compile_hydrator(model, class_):
+    """ Generates a function specialized for a model and a class, that maps
+    elements to objects.
+
+    The properties are unrolled, and the conversions of the builtin types are
+    inlined instead of going through Property.to_py and Type.to_py. Objects are
+    created through __new__ : the __init__ of the class is not run. Properties
+    missing from the element are set to None, unless the class provides a
+    default value.
+
+    :param model: The model of the elements.
+    :type model: graphalchemy.blueprints.schema.Model
+    :param class_: The mapped class.
+    :type class_: object
+    :returns: The hydrating function.
+    :rtype: callable
+    """
+    namespace = {'new': class_.__new__, 'class_': class_, 'MISSING': NO_VALUE}
+    lines = [
+        u'def hydrate(result):',
+        u'    obj = new(class_)',
+        u'    attributes = obj.__dict__',
+        u'    data = {}',
+    ]
+    for position, property in enumerate(model._properties_ordered):
+        name_db, name_py = repr(property.name_db), repr(property.name_py)
+        value = _conversion(namespace, property, 'to_py', position, u'value')
+        lines += [
+            u'    value = result.get('+name_db+u', MISSING)',
+            u'    if value is not MISSING:',
+            u'        data['+name_db+u'] = value',
+            u'        attributes['+name_py+u'] = '+value,
+        ]
+        if not _has_default(class_, property.name_py):
+            lines += [
+                u'    else:',
+                u'        attributes['+name_py+u'] = None',
+            ]
+    if model.is_relationship():
+        lines += [
+            u'    attributes["outV"] = result.get("_outV", None)',
+            u'    attributes["inV"] = result.get("_inV", None)',
+        ]
+    lines += [
+        u'    attributes["id"] = result.get("_id", None)',
+        u'    return obj, data',
+    ]
+    return _compile(lines, namespace, 'hydrate', model)
+
+
+def compile_dehydrator(model, class_):
+    """ Generates a function specialized for a model and a class, that computes
+    the values to store for an object. Nodes store their model name as well.
+
+    :param model: The model of the objects.
+    :type model: graphalchemy.blueprints.schema.Model
+    :param class_: The mapped class.
+    :type class_: object
+    :returns: The dehydrating function.
+    :rtype: callable
+    """
+    namespace = {}
+    lines = [
+        u'def dehydrate(obj):',
+        u'    data = {}',
+    ]
+    for position, property in enumerate(model._properties_ordered):
+        namespace['validate_'+str(position)] = property.validate
+        if IDENTIFIER.match(property.name_py):
+            getter = u'obj.'+property.name_py
+        else:
+            getter = u'getattr(obj, '+repr(property.name_py)+u')'
+        lines += [
+            u'    value = '+getter,
+            u'    validate_'+unicode(position)+u'(value)',
+            u'    data['+repr(property.name_db)+u'] = '+_conversion(namespace, property, 'to_db', position, u'value'),
+        ]
+    if model.is_node():
+        lines.append(u'    data['+repr(model.model_name_storage_key)+u'] = '+repr(model.model_name))
+    lines.append(u'    return data')
+    return _compile(lines, namespace, 'dehydrate', model)
+
+
+def _conversion(namespace, property, method, position, value):
+    """ Builds the expression converting a value, inlined when the conversion
+    is a builtin one.
+
+    :param namespace: The namespace of the generated function, where the
+    conversions that cannot be inlined are bound.
+    :type namespace: dict
+    :param property: The property to convert the value of.
+    :type property: graphalchemy.blueprints.schema.Property
+    :param method: to_py or to_db.
+    :type method: str
+    :param position: The position of the property in the model.
+    :type position: int
+    :param value: The expression of the value to convert.
+    :type value: unicode
+    :returns: The expression of the converted value.
+    :rtype: unicode
+    """
+    # Subclasses of Property may convert values on their own
+    if getattr(property.__class__, method).__func__ is getattr(Property, method).__func__ \
+    and isinstance(property.type, Type):
+        function = getattr(property.type.__class__, method).__func__
+        if function in INLINED:
+            builtin = INLINED[function]
+            if builtin is None:
+                return value
+            return builtin+u'('+value+u')'
+    name = method+'_'+str(position)
+    namespace[name] = getattr(property, method)
+    return unicode(name)+u'('+value+u')'
+
+
+def _has_default(class_, name_py):
+    attribute = class_.__dict__.get(name_py, None)
+    return isinstance(attribute, InstrumentedAttribute) and attribute.default is not NO_VALUE
+
+
+def _compile(lines, namespace, name, model):
+    source = u'\n'.join(lines)+u'\n'
+    code = compile(source, '<graphalchemy '+name+' '+str(model.model_name)+'>', 'exec')
+    exec code in namespace
+    return namespace[name]
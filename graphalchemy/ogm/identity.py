@@ -1,23 +1,341 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+import weakref
+
 from graphalchemy.ogm.state import InstanceState
+from graphalchemy.ogm.attributes import STATE_KEY
+
+
+class IdentityMap(object):
+    """ Maps the objects tracked by a session to their InstanceState.
+
+    Objects are also indexed by their id in the database, so that retrieving an
+    object from its id does not depend on the number of tracked objects.
 
+    By default, the identity map keeps every tracked object alive. Two options
+    bound its memory footprint in long-running processes :
+    - weak : an object is dropped as soon as user code releases it,
+    - max_size : only the max_size most recently used clean objects are kept
+    alive by the map. The others are still tracked, but weakly : they are
+    dropped once user code releases them, never while it holds them, so that
+    an object that was loaded or flushed is always recognized as persisted.
+    Dirty objects, which hold changes that are not flushed yet, are always kept
+    alive and are never evicted.
 
-class IdentityMap(dict):
+    Example use :
+    >>> identity_map = IdentityMap(weak=True, max_size=10000)
+    >>> state = identity_map.add(website, 123)
+    >>> identity_map.get_by_id(123)
+    """
 
-    def __init__(self):
-        pass
+    def __init__(self, weak=False, max_size=None):
+        """ Initializes the identity map.
 
+        :param weak: Whether the objects are only weakly referenced.
+        :type weak: bool
+        :param max_size: The number of objects after which clean objects are
+        evicted, or None for no limit.
+        :type max_size: int
+        """
+        if max_size is not None and max_size < 1:
+            raise Exception('Identity map size must be strictly positive.')
+        self.weak = weak
+        self.max_size = max_size
 
-    def add(self, obj):
+        # Keyed by python object identity, ordered from the least recently used
+        self._states = OrderedDict()
+        # Strong references to the objects that must be kept alive
+        self._objects = {}
+        # Dirty objects, keyed by python object identity
+        self._dirty = set()
+        # Index from database id to python object identity
+        self._ids = {}
+        # Number of pending reasons not to evict, such as running flushes
+        self._eviction_holds = 0
+
+
+    def add(self, obj, id=None):
+        """ Tracks an object, and binds it to its id in the database if given.
+
+        :param obj: The object to track.
+        :type obj: object
+        :param id: The id of the object in the database.
+        :type id: mixed
+        :returns: The state of the object.
+        :rtype: graphalchemy.ogm.state.InstanceState
+        """
+        # Two live objects cannot stand for the same element
+        if id is not None:
+            other = self.get_by_id(id)
+            if other is not None and other is not obj:
+                raise Exception('Another object is already mapped to id '+str(id)+' : '+repr(other))
         if obj in self:
-            return self
-        state = InstanceState(obj)
-        dict.__setitem__(self, obj, state)
+            state = self._states[self._key(obj)]
+        else:
+            state = InstanceState(obj)
+            self._track(obj, state)
+        if id is not None:
+            state.update_id(id)
+            self._ids[id] = self._key(obj)
+        self._touch(obj)
+        return state
+
+
+    def add_all(self, items):
+        """ Tracks several objects that are not tracked yet, in a single pass :
+        the eviction of the least recently used objects only runs once, after
+        all of them are added.
+
+        :param items: The objects, each along with its id in the database and
+        the values it was loaded with.
+        :type items: list<tuple>
+        :returns: The states of the objects.
+        :rtype: list<graphalchemy.ogm.state.InstanceState>
+        """
+        states = []
+        key = None
+        for obj, id, attributes in items:
+            state = InstanceState(obj)
+            self._track(obj, state)
+            key = self._key(obj)
+            if id is not None:
+                state.update_id(id)
+                self._ids[id] = key
+            state.update_attributes(attributes)
+            states.append(state)
+        self._evict(keep=key)
+        return states
 
 
     def get_by_id(self, id):
-    	for obj, state in self.iteritems():
-    		print obj
-    		if obj.id == id:
-    			return obj
-		return None
+        """ :returns: The tracked object that has the given id in the database,
+        or None.
+        :rtype: object
+        """
+        key = self._ids.get(id, None)
+        if key is None:
+            return None
+        obj = self._states[key].obj()
+        if obj is None:
+            return None
+        self._touch(obj)
+        return obj
+
+
+    def mark_dirty(self, obj):
+        """ Flags a tracked object as holding unflushed changes : it is kept
+        alive and cannot be evicted until it is marked clean again.
+
+        :param obj: The tracked object.
+        :type obj: object
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.identity.IdentityMap
+        """
+        key = self._key(obj)
+        if key not in self._states:
+            raise Exception('Object is not tracked by the identity map.')
+        self._dirty.add(key)
+        self._objects[key] = obj
+        return self
+
+
+    def mark_clean(self, obj):
+        """ Flags a tracked object as synchronized with the database.
+
+        :param obj: The tracked object.
+        :type obj: object
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.identity.IdentityMap
+        """
+        key = self._key(obj)
+        if key not in self._dirty:
+            return self
+        self._dirty.discard(key)
+        if self.weak:
+            del self._objects[key]
+        self._evict()
+        return self
+
+
+    @contextmanager
+    def hold_eviction(self):
+        """ Keeps every tracked object alive for the duration of a block, such
+        as the execution of a unit of work : the excess is only evicted once
+        the block is over.
+
+        Example use :
+        >>> with identity_map.hold_eviction():
+        ...     uow.execute()
+        """
+        self._eviction_holds += 1
+        try:
+            yield self
+        finally:
+            self._eviction_holds -= 1
+            self._evict()
+
+
+    def is_dirty(self, obj):
+        """ :returns: Whether the object holds unflushed changes.
+        :rtype: bool
+        """
+        return self._key(obj) in self._dirty
+
+
+    @property
+    def dirty(self):
+        """ :returns: The tracked objects holding unflushed changes.
+        :rtype: list
+        """
+        return [self._objects[key] for key in self._dirty]
+
+
+    def get(self, obj, default=None):
+        if obj in self:
+            return self[obj]
+        return default
+
+
+    def pop(self, obj, *args):
+        if obj in self:
+            state = self[obj]
+            self._untrack(self._key(obj))
+            return state
+        if len(args):
+            return args[0]
+        raise KeyError(obj)
+
 
+    def clear(self):
+        for key in list(self._states):
+            self._untrack(key)
+        self._states.clear()
+        self._objects.clear()
+        self._dirty.clear()
+        self._ids.clear()
+
+
+    def iteritems(self):
+        for state in self._states.values():
+            obj = state.obj()
+            if obj is not None:
+                yield obj, state
+
+
+    def itervalues(self):
+        for obj, state in self.iteritems():
+            yield state
+
+
+    def __iter__(self):
+        for obj, state in self.iteritems():
+            yield obj
+
+
+    def __len__(self):
+        return len(self._states)
+
+
+    def __contains__(self, obj):
+        state = self._states.get(self._key(obj), None)
+        return state is not None and state.obj() is obj
+
+
+    def __getitem__(self, obj):
+        if obj not in self:
+            raise KeyError(obj)
+        return self._states[self._key(obj)]
+
+
+    def __setitem__(self, obj, state):
+        if obj in self:
+            self._untrack(self._key(obj))
+        self._track(obj, state)
+        if state.id is not None:
+            self._ids[state.id] = self._key(obj)
+        self._touch(obj)
+
+
+    def __delitem__(self, obj):
+        if obj not in self:
+            raise KeyError(obj)
+        self._untrack(self._key(obj))
+
+
+    def _key(self, obj):
+        return id(obj)
+
+
+    def _track(self, obj, state):
+        key = self._key(obj)
+        # Let instrumented attributes report their changes
+        state.identity_map = weakref.ref(self)
+        obj.__dict__[STATE_KEY] = state
+        if self.weak or self.max_size is not None:
+            # Forget the object as soon as it is garbage collected
+            state.obj = weakref.ref(obj, self._on_collect(key))
+        if not self.weak:
+            self._objects[key] = obj
+        self._states[key] = state
+
+
+    def _untrack(self, key):
+        state = self._states.pop(key)
+        state.identity_map = None
+        obj = state.obj()
+        if obj is not None and obj.__dict__.get(STATE_KEY, None) is state:
+            del obj.__dict__[STATE_KEY]
+        self._objects.pop(key, None)
+        self._dirty.discard(key)
+        if state.id is not None and self._ids.get(state.id) == key:
+            del self._ids[state.id]
+
+
+    def _on_collect(self, key):
+        identity_map = weakref.ref(self)
+        def callback(ref):
+            self = identity_map()
+            if self is None:
+                return
+            state = self._states.get(key, None)
+            if state is not None and state.obj is ref:
+                self._untrack(key)
+        return callback
+
+
+    def _touch(self, obj):
+        """ Marks an object as the most recently used one, and evicts the least
+        recently used ones if the map grew too big.
+        """
+        if self.max_size is None:
+            return self
+        key = self._key(obj)
+        self._states[key] = self._states.pop(key)
+        if not self.weak:
+            self._objects[key] = obj
+        self._evict(keep=key)
+        return self
+
+
+    def _evict(self, keep=None):
+        """ Releases the least recently used clean objects until the map keeps
+        at most max_size of them alive. Released objects stay tracked until
+        user code releases them as well.
+        """
+        if self.max_size is None or self.weak or self._eviction_holds:
+            return self
+        excess = len(self._objects) - len(self._dirty) - self.max_size
+        if excess <= 0:
+            return self
+        evicted = []
+        for key in self._states:
+            if excess <= 0:
+                break
+            if key in self._dirty or key == keep or key not in self._objects:
+                continue
+            evicted.append(key)
+            excess -= 1
+        for key in evicted:
+            # Unreferenced objects are collected, and untracked, right away
+            del self._objects[key]
+        return self
@@ -5,6 +5,11 @@
 #                                      IMPORTS
 # ==============================================================================
 
+from graphalchemy.ogm.attributes import instrument
+from graphalchemy.ogm.hydration import compile_dehydrator
+from graphalchemy.ogm.hydration import compile_hydrator
+
+
 class Mapper(object):
     """
     """
@@ -20,8 +25,15 @@ class Mapper(object):
     def register(self, class_, model, adjacencies={}):
 
         # Instrument class attributes
+        for property in model._properties.values():
+            instrument(class_, property.name_py)
+
         # Instrument class adjacencies
 
+        # Generate the mapping functions of the class
+        model._hydrators[class_] = compile_hydrator(model, class_)
+        model._dehydrators[class_] = compile_dehydrator(model, class_)
+
         # Update the metadata to register the class
         model.register_class(class_)
 
@@ -0,0 +1,54 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#                                      IMPORTS
+# ==============================================================================
+
+
+# ==============================================================================
+#                                     OPTIONS
+# ==============================================================================
+
+class EagerLoad(object):
+    """ Loads an adjacency of the queried nodes along with the nodes themselves,
+    within the same traversal, instead of one traversal per node later on.
+
+    Example use :
+    >>> pages = repository.filter().options(eager('isHostedBy')).all()
+    >>> pages[0]._cache_in_hosts
+    {<WebsiteHostsPage>: <Website>}
+
+    The relations are stored in the cache that graphalchemy.model.Node._relation
+    reads from, keyed by the direction of the adjacency and the label of its
+    relationship.
+    """
+
+    def __init__(self, name):
+        """ Initializes the option.
+
+        :param name: The name of the adjacency, as registered by the mapper.
+        :type name: str
+        """
+        self.name = name
+
+
+    def __repr__(self):
+        return '<EagerLoad('+self.name+')>'
+
+
+
+def eager(name):
+    """ :returns: The option loading an adjacency along with the queried nodes.
+    :rtype: graphalchemy.ogm.options.EagerLoad
+    """
+    return EagerLoad(name)
+
+
+def cache_name(direction, label):
+    """ :returns: The attribute holding the loaded relations of a node, as
+    named by graphalchemy.model.Node._relation.
+    :rtype: str
+    """
+    return '_cache'+'_'+direction+'_'+label
+
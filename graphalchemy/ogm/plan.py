@@ -0,0 +1,238 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#                                      IMPORTS
+# ==============================================================================
+
+from collections import OrderedDict
+import json
+
+from graphalchemy.ogm.bulk import BulkWriter
+from graphalchemy.ogm.unitofwork import changes
+from graphalchemy.ogm.unitofwork import insert_data
+
+
+# ==============================================================================
+#                                     SERVICE
+# ==============================================================================
+
+class FlushPlan(object):
+    """ The pending changes of a session, sorted once in dependency order.
+
+    Each object is classified once, when it is added to the plan. The work is
+    then split in successive stages, a stage depending on the previous ones :
+    - insert_nodes,
+    - insert_relationships, which need the ids of their endpoints,
+    - update, nodes and relationships alike,
+    - delete_relationships,
+    - delete_nodes, once the relationships that bind them are gone.
+    Within a stage, objects are grouped by model : the groups do not depend on
+    each other, and can be sent concurrently.
+
+    Example use :
+    >>> plan = session.plan()
+    >>> plan.count_requests()
+    3
+    >>> plan.groups('insert_nodes').keys()
+    ['Website', 'Page']
+    """
+
+    STAGES = ('insert_nodes', 'insert_relationships', 'update', 'delete_relationships', 'delete_nodes')
+
+    def __init__(self, metadata_map, identity_map, chunk_size=None, batch_size=None):
+        """ Initializes an empty plan.
+
+        :param metadata_map: The metadata of the mapped classes.
+        :type metadata_map: graphalchemy.blueprints.schema.MetaData
+        :param identity_map: The identity map of the session.
+        :type identity_map: graphalchemy.ogm.identity.IdentityMap
+        :param chunk_size: The maximum number of elements per request.
+        :type chunk_size: int
+        :param batch_size: The maximum number of objects per unit of work, or
+        None for a single unit of work.
+        :type batch_size: int
+        """
+        self.metadata_map = metadata_map
+        self.identity_map = identity_map
+        if chunk_size is None:
+            chunk_size = BulkWriter.CHUNK_SIZE
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self._stages = OrderedDict((stage, OrderedDict()) for stage in self.STAGES)
+        self._length = 0
+
+
+    def add(self, obj, state):
+        """ Classifies a pending object in its stage and group.
+
+        :param obj: The pending object.
+        :type obj: object
+        :param state: The pending operation : new, update or delete.
+        :type state: str
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.plan.FlushPlan
+        """
+        class_meta = self.metadata_map.for_object(obj)
+        if state == 'new':
+            stage = 'insert_nodes' if class_meta.is_node() else 'insert_relationships'
+        elif state == 'update':
+            stage = 'update'
+        elif state == 'delete':
+            stage = 'delete_nodes' if class_meta.is_node() else 'delete_relationships'
+        else:
+            raise Exception('Unknown operation : '+str(state))
+        self._stages[stage].setdefault(class_meta.model_name, []).append(obj)
+        self._length += 1
+        return self
+
+
+    def groups(self, stage):
+        """ :returns: The objects of a stage, grouped by model name.
+        :rtype: OrderedDict
+        """
+        return self._stages[stage]
+
+
+    def operations(self):
+        """ :returns: The pending objects along with their operation, in an
+        order that satisfies the dependencies.
+        :rtype: list<tuple>
+        """
+        return [(obj, self._state(stage)) for obj, stage in self._staged()]
+
+
+    def count_requests(self):
+        """ Counts the requests that flushing this plan will send, without
+        contacting the database.
+
+        :returns: The number of requests.
+        :rtype: int
+        """
+        return self.explain()['requests']
+
+
+    def explain(self):
+        """ Describes what flushing this plan will send, without contacting the
+        database.
+
+        Inserts and deletes are sent by chunks, once per unit of work, while
+        each object that actually changed is updated by its own request.
+        Unchanged objects and unpersisted deletes are left out, as the flush
+        skips them. The payload size counts the JSON bodies of the requests, the
+        ids of the endpoints inserted by the same flush being unknown yet.
+
+        :returns: A dictionnary holding :
+        - inserts : the new objects, with their model,
+        - updates : the changed objects, with their model, id and the names in
+        the database of their changed properties,
+        - deletes : the removed objects, with their model and id,
+        - requests : the number of HTTP requests,
+        - bytes : the size of the request payloads.
+        :rtype: dict
+        """
+        writer = BulkWriter(None, chunk_size=self.chunk_size)
+        explanation = {'inserts': [], 'updates': [], 'deletes': [], 'requests': 0, 'bytes': 0}
+        bodies = []
+
+        staged = list(self._staged())
+        batch_size = self.batch_size or max(len(staged), 1)
+        for start in xrange(0, len(staged), batch_size):
+            vertices, edges, edge_ids, vertex_ids = [], [], [], []
+            for obj, stage in staged[start:start+batch_size]:
+                class_meta = self.metadata_map.for_object(obj)
+                operation = {'model': class_meta.model_name, 'object': obj}
+
+                if stage == 'insert_nodes':
+                    vertices.append(insert_data(obj, class_meta))
+                    explanation['inserts'].append(operation)
+
+                elif stage == 'insert_relationships':
+                    edges.append({
+                        'outV': self._endpoint_id(obj, 'outV'),
+                        'inV': self._endpoint_id(obj, 'inV'),
+                        'label': class_meta.model_name,
+                        'data': insert_data(obj, class_meta)
+                    })
+                    explanation['inserts'].append(operation)
+
+                elif stage == 'update':
+                    data = self.changes(obj)
+                    if not len(data):
+                        continue
+                    operation['id'] = self.identity_map[obj].id
+                    operation['changed'] = sorted(data.keys())
+                    explanation['updates'].append(operation)
+                    bodies.append(dict((key, value) for key, value in data.iteritems() if value is not None))
+
+                else:
+                    operation['id'] = self._persisted_id(obj)
+                    if operation['id'] is None:
+                        continue
+                    if stage == 'delete_nodes':
+                        vertex_ids.append(operation['id'])
+                    else:
+                        edge_ids.append(operation['id'])
+                    explanation['deletes'].append(operation)
+
+            requests = list(writer.vertex_requests(vertices)) \
+                     + list(writer.edge_requests(edges)) \
+                     + list(writer.delete_requests(edge_ids, vertex_ids))
+            bodies.extend({'script': script, 'params': params} for script, params in requests)
+
+        explanation['requests'] = len(bodies)
+        explanation['bytes'] = sum(len(json.dumps(body)) for body in bodies)
+        return explanation
+
+
+    def changes(self, obj):
+        """ :returns: The properties of a tracked object that changed since the
+        last flush, as they must be stored in the database.
+        :rtype: dict
+        """
+        return changes(obj, self.identity_map[obj], self.metadata_map.for_object(obj))
+
+
+    def _staged(self):
+        for stage, groups in self._stages.iteritems():
+            for objs in groups.itervalues():
+                for obj in objs:
+                    yield obj, stage
+
+
+    def _endpoint_id(self, obj, endpoint):
+        """ :returns: The id of an endpoint of a relationship if it is known
+        already, None otherwise.
+        :rtype: mixed
+        """
+        vertex = getattr(obj, endpoint, None)
+        if isinstance(vertex, (int, long, basestring)):
+            return vertex
+        if vertex is not None and vertex in self.identity_map:
+            return self.identity_map[vertex].id
+        return None
+
+
+    def _persisted_id(self, obj):
+        if obj in self.identity_map:
+            return self.identity_map[obj].id
+        return getattr(obj, 'id', None)
+
+
+    def _state(self, stage):
+        if stage.startswith('insert'):
+            return 'new'
+        if stage.startswith('delete'):
+            return 'delete'
+        return 'update'
+
+
+    def __len__(self):
+        return self._length
+
+
+    def __repr__(self):
+        return '<FlushPlan('+', '.join(
+            stage+'='+str(sum(len(objs) for objs in groups.itervalues()))
+            for stage, groups in self._stages.iteritems()
+        )+')>'
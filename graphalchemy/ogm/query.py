@@ -5,7 +5,15 @@
 #                                      IMPORTS
 # ==============================================================================
 
-from urllib import quote, quote_plus, urlencode
+from collections import OrderedDict
+import base64
+import json
+
+from graphalchemy.blueprints.predicates import Predicate
+from graphalchemy.blueprints.predicates import quote_key
+from graphalchemy.blueprints.schema import Node
+from graphalchemy.ogm.hydration import hydrator
+from graphalchemy.ogm.options import cache_name
 
 
 # ==============================================================================
@@ -24,18 +32,62 @@ class MultipleResultsFound(Exception):
 # ==============================================================================
 
 class Query(object):
+    """ Queries are compiled to parameterized Gremlin scripts : the filters,
+    the index to start from and the pagination are all applied by the server,
+    and only the matching elements are sent back. The results are mapped to
+    objects through the identity map of the session.
+
+    Queries are usually built from a repository :
+    >>> query = repository.filter(title=u'Lasagna')
+    >>> pages = query.offset(20).limit(10).all()
+    >>> page = repository.filter(url=u'http://allrecipes.com/lasagna').first()
+    """
+
+    # The maximum number of compiled scripts kept in cache
+    SCRIPT_CACHE_SIZE = 1024
+
+    # Compiled scripts, keyed by query shape, shared by all queries
+    _scripts = {}
 
-    def __init__(self, session, *args, **kwargs):
+    # Looks up the ids of the elements matching each indexed filter
+    LOOKUP_IDS = u'lookups.collect{ g.V(it.key, it.value).id.toList() }'
+
+    def __init__(self, session, model=None, class_=None, logger=None):
+        """ Initializes the query.
+
+        :param session: The session to perform requests against.
+        :type session: graphalchemy.ogm.session.Session
+        :param model: The model of the queried elements.
+        :type model: graphalchemy.blueprints.schema.Model
+        :param class_: The class the queried elements are mapped to.
+        :type class_: object
+        :param logger: An optionnal logger.
+        :type logger: logging.Logger
+        """
         self.session = session
+        self.model = model
+        self.class_ = class_
         self._filters = {}
+        self._predicates = []
         self._indices = {}
         self._offset = None
         self._limit = None
         self._results = None
-        self.logger = kwargs.get('logger', None)
+        self._yield_per = None
+        self._track = True
+        self._order_by = None
+        self._after = None
+        self._intersect = False
+        self._eager = []
+        self._ids = None
+        self.logger = logger
 
 
     def __iter__(self):
+        if self._yield_per is not None:
+            for obj in self._stream():
+                yield obj
+            return
         if self._results is None:
             self.execute()
         for result in self._results:
@@ -43,77 +95,400 @@ class Query(object):
 
 
     def execute(self):
-        path = self.build_path(**self._filters)
-        response = self.session.client.request.get(path, params=None)
-        print response
-        self._results = response.results
+        """ Sends the query to the database, and maps the results.
+
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.Query
+        """
+        self._results = self._load_all(self._fetch(), self._track)
+        return self
+
+
+    def yield_per(self, count, track=True):
+        """ Streams the results by pages of count elements : a page is only
+        requested once the previous one has been iterated over, and its objects
+        are mapped one at a time. The results are not kept by the query.
+
+        Example use :
+        >>> for page in repository.filter().yield_per(1000, track=False):
+        ...     export(page)
+
+        :param count: The number of elements per page.
+        :type count: int
+        :param track: Whether the mapped objects are registered in the identity
+        map. Untracked objects do not keep memory busy, but cannot be updated
+        through the session.
+        :type track: bool
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.Query
+        """
+        if count < 1:
+            raise Exception('Page size must be strictly positive.')
+        self._yield_per = count
+        self._track = track
+        self._results = None
         return self
 
 
     def indexed_filter(self, index_name, key, value):
+        """ Starts the query from an index lookup.
+
+        :param index_name: The name of the index.
+        :type index_name: str
+        :param key: The key to look up, as stored in the database.
+        :type key: str
+        :param value: The value to look up.
+        :type value: mixed
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.Query
+        """
         self._indices[index_name] = {"key": key, "value":value}
         return self
 
 
-    def filter(self, **kwargs):
+    def filter(self, *predicates, **kwargs):
         """ Performs a filtering operation on the given repository. Automaticaly
         decides which index to use :
-        - the eid index if provided
+        - the id if provided
         - the first property key index that is matched
+        - one lookup per value of an in predicate on an indexed property
+        - the index on the model name otherwise
         Will add extra filtering as simple as queries.
 
         Example :
-        >>> iterator = repository.filter(domain='http://www.foo.com', name='Foo')
-        >>> iterator = repository.filter(eid=123)
-        >>> iterator = repository.filter(indexed_property='Foo')
-
-        @todo : it should return an iterator and wait for extra filtering.
-        @todo : only limited to filtering on one entity for now.
+        >>> query = query.filter(domain='http://www.foo.com', name='Foo')
+        >>> query = query.filter(id=123)
+        >>> query = query.filter(Recipe.timeTotal < 30, Recipe.url.in_(urls))
 
-        :returns: generator -- The list of models that match the query.
+        :param predicates: Comparisons on the properties, built from the
+        attributes of the mapped class.
+        :type predicates: list<graphalchemy.blueprints.predicates.Predicate>
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.Query
         """
+        for predicate in predicates:
+            # Equalities can use the indices as any other filter
+            if predicate.operator == 'eq':
+                self._filters[predicate.key] = predicate.value
+            else:
+                self._predicates.append(predicate)
         self._filters.update(kwargs)
+        self._results = None
+        return self
+
+
+    def with_ids(self, ids):
+        """ Restricts the query to the elements with the given ids, all fetched
+        by a single request.
+
+        Example use :
+        >>> pages = repository.filter().with_ids([12, 13, 14]).all()
+
+        :param ids: The ids of the elements.
+        :type ids: list
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.Query
+        """
+        self._ids = list(ids)
+        self._results = None
+        return self
+
+
+    def intersect(self, enabled=True):
+        """ Uses all the indexed filters instead of the most selective one only.
+        Each index is looked up for ids only, the ids are intersected by the
+        client, and only the elements of the intersection are fetched, by a
+        single request.
+
+        Example use :
+        >>> websites = repository.filter(name=u'Foo', domain=u'foo.com').intersect().all()
+
+        :param enabled: Whether to intersect the indices.
+        :type enabled: bool
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.Query
+        """
+        self._intersect = enabled
+        self._results = None
+        return self
+
+
+    def options(self, *options):
+        """ Applies loading options to the query.
+
+        Example use :
+        >>> pages = repository.filter().options(eager('isHostedBy')).all()
+
+        :param options: The options, such as graphalchemy.ogm.options.eager.
+        :type options: list<graphalchemy.ogm.options.EagerLoad>
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.Query
+        """
+        for option in options:
+            if self.model is None or not self.model.is_node() \
+            or option.name not in self.model._adjacencies:
+                raise Exception('Unknown adjacency : '+str(option.name))
+            if not self.model._adjacencies[option.name].relationship.is_relationship():
+                raise Exception('Adjacency '+str(option.name)+' is not bound to a relationship.')
+            if option.name not in self._eager:
+                self._eager.append(option.name)
+        self._results = None
         return self
 
 
-    def build_path(self, **kwargs):
-        """ Builds a gremlin query string from a set of filtering arguments.
-        @todo : no escaping is implemented yet.
+    def compile(self):
+        """ Builds the gremlin script of the query. The values are only bound as
+        parameters, so that the script only depends on the shape of the query :
+        it is built once per shape, then served from a cache. Identical scripts
+        also let the server reuse its own compiled version of the script.
 
-        :returns: string, dict -- The gremlin query.
+        :returns: The gremlin script and its parameters.
+        :rtype: unicode, dict
         """
-        def clean(value):
-            return quote(unicode(value), safe='')
+        return self._compile(None)
 
-        path = ''
+
+    def _compile(self, ids, eager=True):
+        """ Builds the gremlin script of the query, from the script cache.
+
+        :param ids: The ids to start from, or None.
+        :type ids: list
+        :param eager: Whether the eagerly loaded adjacencies are fetched too.
+        :type eager: bool
+        :returns: The gremlin script and its parameters.
+        :rtype: unicode, dict
+        """
+        shape, params = self._bind(ids, eager)
+        script = self._scripts.get(shape, None)
+        if script is None:
+            if len(self._scripts) >= self.SCRIPT_CACHE_SIZE:
+                self._scripts.clear()
+            script = self._scripts[shape] = self._build_script(shape)
+        return script, params
+
+
+    def _bind(self, ids=None, eager=True):
+        """ Decides how the query is run, and binds the values of the query.
+
+        :param ids: The ids to start from, when the indexed filters have been
+        resolved by an intersection. None otherwise.
+        :type ids: list
+        :param eager: Whether the eagerly loaded adjacencies are fetched too.
+        :type eager: bool
+        :returns: The shape of the query, that determines its script, and the
+        parameters of the script.
+        :rtype: tuple, dict
+        """
+        params = {}
+        filters = dict(self._filters)
+        predicates = list(self._predicates)
+        index_key = None
+
+        # If the ids are given, or the indices have been intersected :
+        if ids is not None:
+            start = 'ids'
+            params['ids'] = ids
+            if self._ids is None:
+                for name in self._useful_indices(filters):
+                    del filters[name]
 
         # If the id is in the parameters :
-        if 'id' in kwargs:
-            path = '/vertices/'+clean(kwargs['id'])
-            return path
+        elif 'id' in filters:
+            start = 'id'
+            params['id'] = filters.pop('id')
 
         # If one of the parameters is indexed :
-        if self._indices:
-            for key, value in self._indices:
-                path += '/indices/'+clean(index)+u'?key='+clean(key)+u'&value='+clean(val)
-                # For now, we can only query on one index
-                break
-            # For now, we can only handle one index
-            return path
+        elif self._indices or self._useful_indices(filters):
+            start = 'index'
+            if self._indices:
+                index = self._indices.values()[0]
+                index_key, params['index_value'] = index['key'], index['value']
+            else:
+                name = self._useful_indices(filters)[0]
+                index_key, params['index_value'] = self._name_db(name), filters.pop(name)
 
-        # If no parameter is indexed :
-        if self.model.is_node():
-            path += '/vertices'
+        # If the values of an in predicate are indexed :
+        elif self._useful_lookups(predicates):
+            start = 'lookups'
+            predicate = self._useful_lookups(predicates)[0]
+            predicates.remove(predicate)
+            index_key = self._name_db(predicate.key)
+            params['index_values'] = self._bind_predicate(predicate)
+
+        # If a comparison is made on an indexed property, it starts the query :
+        elif self._useful_ranges(predicates):
+            start = 'range'
+            predicate = self._useful_ranges(predicates)[0]
+            predicates.remove(predicate)
+            predicates.insert(0, predicate)
+
+        # If resuming in the order of an indexed property, from the index :
+        elif self._after is not None and self._order_by not in (None, 'id'):
+            start = 'after'
+
+        # Else, we simply use the index on the model name.
+        elif self.model is not None:
+            start = 'model'
         else:
-            path += '/edges'
+            start = 'all'
+
+        model_key = None
+        if self.model is not None:
+            model_key = self.model.model_name_storage_key
+            params['model_name'] = self.model.model_name
+
+        # Remaining filters are bound by position
+        names = []
+        for position, name in enumerate(sorted(filters)):
+            names.append(self._name_db(name))
+            params[u'p'+unicode(position)] = filters[name]
+
+        # Predicates as well, in the order they were given
+        comparisons = []
+        for position, predicate in enumerate(predicates):
+            comparisons.append((self._name_db(predicate.key), predicate.operator))
+            params[u'q'+unicode(position)] = self._bind_predicate(predicate)
+
+        order_key = self._order_by
+        if order_key is not None and order_key != 'id':
+            order_key = self._name_db(order_key)
+        if self._after is not None:
+            params['after_value'], params['after_id'] = self._after
+
+        paginated = self._offset is not None or self._limit is not None
+        if paginated:
+            low = self._offset or 0
+            params['low'] = low
+            params['high'] = -1 if self._limit is None else low + self._limit - 1
+
+        # Adjacencies are fetched along with each element
+        adjacencies = []
+        if eager:
+            for name in self._eager:
+                adjacency = self.model._adjacencies[name]
+                adjacencies.append((adjacency.relationship.model_name, adjacency.direction))
+
+        shape = (self._element_step(), model_key, start, index_key, tuple(names),
+                 tuple(comparisons), order_key, self._after is not None, paginated,
+                 tuple(adjacencies))
+        return shape, params
+
+
+    def _build_script(self, shape):
+        """ Builds the script of a query shape.
+
+        :param shape: The shape of the query, as returned by _bind.
+        :type shape: tuple
+        :returns: The gremlin script.
+        :rtype: unicode
+        """
+        step, model_key, start, index_key, names, comparisons, order_key, after, paginated, adjacencies = shape
+
+        if start == 'id':
+            script = u'[g.'+step.lower()+u'(id)].findAll{ it != null }._()'
+        elif start == 'ids':
+            script = u'ids.collect{ g.'+step.lower()+u'(it) }.findAll{ it != null }._()'
+        elif start == 'index':
+            script = u'g.'+step+u'('+quote_key(index_key)+u', index_value)'
+        elif start == 'lookups':
+            script = Predicate.lookup(unicode(index_key), u'index_values', step)
+        elif start == 'range':
+            name, operator = comparisons[0]
+            script = u'g.'+step+Predicate.step(unicode(name), operator, u'q0')
+        elif start == 'after':
+            script = u'g.'+step+u'.has('+quote_key(order_key)+u', T.gte, after_value)'
+        elif start == 'model' and step == u'V':
+            script = u'g.V('+quote_key(model_key)+u', model_name)'
+        else:
+            script = u'g.'+step
+
+        # Other models may share the id or the index
+        if model_key is not None and not (start == 'model' and step == u'V'):
+            script += u'.has('+quote_key(model_key)+u', model_name)'
 
         # Fillup with remaining filters
-        for key, val in kwargs.iteritems():
-            path += u'?key='+clean(key)+u'&value='+clean(val)
-            # For now, Rexster seems to support only one key/value query
-            break
+        for position, name in enumerate(names):
+            script += u'.has('+quote_key(name)+u', p'+unicode(position)+u')'
+        for position, (name, operator) in enumerate(comparisons):
+            if start == 'range' and position == 0:
+                continue
+            script += Predicate.step(unicode(name), operator, u'q'+unicode(position))
+
+        # Resume after the last seen key
+        if order_key == 'id':
+            if after:
+                script += u'.has("id", T.gt, after_id)'
+            compare = lambda a, b: a+u'.id <=> '+b+u'.id'
+        elif order_key is not None:
+            key = quote_key(order_key)
+            if after:
+                if start != 'after':
+                    script += u'.has('+key+u', T.gte, after_value)'
+                script += u'.or(_().has('+key+u', T.gt, after_value), _().has("id", T.gt, after_id))'
+            compare = lambda a, b: a+u'.getProperty('+key+u') <=> '+b+u'.getProperty('+key+u') ?: '+a+u'.id <=> '+b+u'.id'
+
+        # Indices do not return elements in key order : paginated queries only
+        # keep the first high + 1 elements while scanning, instead of sorting
+        # all of them
+        if order_key is not None and paginated:
+            script += u'.inject(new TreeSet({ a, b -> '+compare(u'a', u'b')+u' } as Comparator))'
+            script += u'{ top, element -> top.add(element); if (high >= 0 && top.size() > high + 1) top.pollLast(); top }._()'
+        elif order_key is not None:
+            script += u'.order{ '+compare(u'it.a', u'it.b')+u' }'
+
+        # Paginate on the server side
+        if paginated:
+            script += u'.range(low, high)'
 
-        return path
+        # Each element comes along with its edges and the nodes at their end
+        if len(adjacencies):
+            script += u'.transform{ element -> [element'
+            for label, direction in adjacencies:
+                script += u', element.'+direction+u'E("'+unicode(label)+u'").collect{ edge -> [edge, '
+                if direction == 'in':
+                    script += u'edge.getVertex(Direction.OUT)'
+                elif direction == 'out':
+                    script += u'edge.getVertex(Direction.IN)'
+                else:
+                    script += u'edge.getVertex(Direction.OUT) == element ? edge.getVertex(Direction.IN) : edge.getVertex(Direction.OUT)'
+                script += u'] }'
+            script += u'] }'
+
+        return script
+
+
+    def count(self):
+        """ Counts the matching elements on the server side : only the number
+        is sent back.
+
+        Example use :
+        >>> repository.filter(domain=u'http://www.allrecipes.com').count()
+        1024
+
+        :returns: The number of matching elements.
+        :rtype: int
+        """
+        prepared = self._prepare(eager=False)
+        if prepared is None:
+            return 0
+        script, params = prepared
+        results = self._run(script+u'.count()', params)
+        return int(results[0]) if len(results) else 0
+
+
+    def exists(self):
+        """ Checks on the server side whether an element matches : the server
+        stops at the first match, and only a boolean is sent back.
+
+        :returns: Whether at least one element matches.
+        :rtype: bool
+        """
+        prepared = self._prepare(eager=False)
+        if prepared is None:
+            return False
+        script, params = prepared
+        results = self._run(script+u'.hasNext()', params)
+        return len(results) > 0 and bool(results[0])
 
 
     def all(self):
@@ -132,9 +507,10 @@ class Query(object):
         rows are returned for a query that does not return object
         identities.
 
-        Calling one() results in an execution of the underlying query.
+        Calling one() results in an execution of the underlying query, that
+        fetches at most two rows.
         """
-        ret = list(self)
+        ret = self._head(2).all()
 
         l = len(ret)
         if l == 1:
@@ -149,9 +525,10 @@ class Query(object):
         """Return the first result of this Query or None if the result doesn't
         contain any row.
 
-        Calling ``first()`` results in an execution of the underlying query.
+        Calling ``first()`` results in an execution of the underlying query,
+        that fetches at most one row.
         """
-        ret = list(self)[0:1]
+        ret = self._head(1).all()
         if len(ret) > 0:
             return ret[0]
         else:
@@ -160,11 +537,11 @@ class Query(object):
 
     def slice(self, start, stop):
         """apply LIMIT/OFFSET to the ``Query`` based on a "
-        "range and return the newly resulting ``Query``."""
+        "range and return the resulting ``Query``."""
 
         if start is not None and stop is not None:
             self._offset = (self._offset or 0) + start
-            self._limit = stop - start
+            self._limit = max(stop - start, 0)
         elif start is None and stop is not None:
             self._limit = stop
         elif start is not None and stop is None:
@@ -172,19 +549,485 @@ class Query(object):
 
         if self._offset == 0:
             self._offset = None
+        self._results = None
+        return self
 
 
     def limit(self, limit):
-        """Apply a ``LIMIT`` to the query and return the newly resulting
+        """Apply a ``LIMIT`` to the query and return the resulting
         ``Query``.
         """
         self._limit = limit
+        self._results = None
+        return self
 
     def offset(self, offset):
-        """Apply an ``OFFSET`` to the query and return the newly resulting
+        """Apply an ``OFFSET`` to the query and return the resulting
         ``Query``.
         """
         self._offset = offset
+        self._results = None
+        return self
+
+
+    def order_by(self, key='id'):
+        """ Orders the results by element id, or by an indexed property then
+        by element id. Ordered queries can be paginated with cursors.
+
+        :param key: The name of the property in Python, or id.
+        :type key: str
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.query.Query
+        """
+        if key != 'id' and (self.model is None or key not in self.model.indices):
+            raise Exception('Can only order by id or by an indexed property, got '+str(key))
+        self._order_by = key
+        self._results = None
+        return self
+
+
+    def page(self, size, cursor=None):
+        """ Fetches a page of ordered results, resuming after the last element
+        of the previous page.
+
+        This is not keyset pagination : Blueprints indices do not return the
+        elements in key order, so that the server scans every matching element
+        after the cursor to find the next ones. It only keeps the size + 1
+        smallest elements while scanning, so that a page costs one scan and
+        no sort of the whole range. When ordered by an indexed property, the
+        next pages start from the index at the last seen value. Pages ordered
+        by id scan all the matching elements. Deep pages are therefore no
+        faster than the first ones, but they are no slower either, unlike
+        offsets.
+
+        Example use :
+        >>> query = repository.filter().order_by('id')
+        >>> pages, cursor = query.page(50)
+        >>> next_pages, cursor = query.page(50, cursor)
+
+        :param size: The number of elements per page.
+        :type size: int
+        :param cursor: The cursor returned along with the previous page, or
+        None for the first page.
+        :type cursor: str
+        :returns: The objects of the page, and the cursor of the next page, or
+        None if this page is the last one.
+        :rtype: list, str
+        """
+        if self._order_by is None:
+            raise Exception('Cursor pagination needs an ordered query.')
+        if size < 1:
+            raise Exception('Page size must be strictly positive.')
+        query = self._clone()
+        query._offset = None
+        # One more element tells whether there is a next page
+        query._limit = size + 1
+        if cursor is not None:
+            query._after = self._decode_cursor(cursor)
+        results = query._fetch()
+
+        next_cursor = None
+        if len(results) > size:
+            results = results[0:size]
+            next_cursor = self._encode_cursor(self._root(results[-1]))
+        return self._load_all(results, self._track), next_cursor
+
+
+    def _encode_cursor(self, result):
+        """ :returns: An opaque cursor pointing after the given element.
+        :rtype: str
+        """
+        value = None
+        if self._order_by != 'id':
+            value = result.get(self._name_db(self._order_by), None)
+        return base64.urlsafe_b64encode(json.dumps([value, result['_id']]))
+
+
+    def _decode_cursor(self, cursor):
+        """ :returns: The key of the element a cursor points after.
+        :rtype: tuple
+        """
+        try:
+            value, id = json.loads(base64.urlsafe_b64decode(str(cursor)))
+        except (TypeError, ValueError):
+            raise Exception('Invalid cursor : '+str(cursor))
+        return value, id
+
+
+    def _fetch(self):
+        """ Sends the query to the database.
+
+        :returns: The elements, as returned by the database.
+        :rtype: list<dict>
+        """
+        prepared = self._prepare()
+        if prepared is None:
+            return []
+        return self._run(*prepared)
+
+
+    def _prepare(self, eager=True):
+        """ Compiles the query, after intersecting the indices if requested.
+
+        :param eager: Whether the eagerly loaded adjacencies are fetched too.
+        :type eager: bool
+        :returns: The gremlin script and its parameters, or None if nothing can
+        match the query.
+        :rtype: unicode, dict
+        """
+        if self._limit == 0:
+            return None
+        ids = self._ids
+        if ids is None:
+            ids = self._intersected_ids()
+        if ids is not None and not len(ids):
+            return None
+        return self._compile(ids, eager)
+
+
+    def _intersected_ids(self):
+        """ Looks up the ids matching each indexed filter, all at once, and
+        intersects them.
+
+        :returns: The ids matching all the indexed filters, in the order of the
+        most selective index, or None if there is nothing to intersect.
+        :rtype: list
+        """
+        if not self._intersect or 'id' in self._filters or self._indices:
+            return None
+        names = self._useful_indices(self._filters)
+        if len(names) < 2:
+            return None
+        lookups = [{'key': self._name_db(name), 'value': self._filters[name]} for name in names]
+        script = self.LOOKUP_IDS.replace(u'g.V', u'g.'+self._element_step())
+        results = self._run(script, {'lookups': lookups})
+        ids = list(results[0]) if len(results) else []
+        for other in results[1:]:
+            other = set(other)
+            ids = [id for id in ids if id in other]
+        self._log(unicode(len(ids))+u' ids left after intersection')
+        return ids
+
+
+    def _run(self, script, params):
+        """ Executes a script and returns its raw results.
+
+        :param script: The gremlin script.
+        :type script: unicode
+        :param params: The parameter bindings of the script.
+        :type params: dict
+        :returns: The raw results of the script.
+        :rtype: list
+        """
+        self._log(script+u', '+unicode(params))
+        response = self.session.client.gremlin(script, params)
+        results = response.content['results']
+        if results is None:
+            return []
+        return results
+
+
+    def _stream(self):
+        """ Iterates over the results, one page at a time.
+
+        :returns: The mapped objects.
+        :rtype: generator
+        """
+        start = self._offset or 0
+        remaining = self._limit
+        while remaining is None or remaining > 0:
+            count = self._yield_per
+            if remaining is not None:
+                count = min(count, remaining)
+                remaining -= count
+            page = self._clone()
+            page._offset = start
+            page._limit = count
+            results = page._fetch()
+            for obj in self._load_all(results, self._track):
+                yield obj
+            if len(results) < count:
+                break
+            start += count
+
+
+    def _head(self, count):
+        """ :returns: A copy of this query, restricted to its first rows.
+        :rtype: graphalchemy.ogm.query.Query
+        """
+        query = self._clone()
+        if query._limit is None or query._limit > count:
+            query._limit = count
+        return query
+
+
+    def _clone(self):
+        """ :returns: A copy of this query, that has not been executed yet.
+        :rtype: graphalchemy.ogm.query.Query
+        """
+        query = Query(self.session, self.model, self.class_, logger=self.logger)
+        query._filters = dict(self._filters)
+        query._predicates = list(self._predicates)
+        query._indices = dict(self._indices)
+        query._offset = self._offset
+        query._limit = self._limit
+        query._track = self._track
+        query._order_by = self._order_by
+        query._after = self._after
+        query._intersect = self._intersect
+        query._eager = list(self._eager)
+        query._ids = self._ids
+        return query
+
+
+    def _load_all(self, rows, track=True):
+        """ Maps a page of rows returned by the database to objects, along with
+        the adjacencies that were eagerly loaded.
+
+        :param rows: The elements, each followed by the edges and nodes of each
+        eagerly loaded adjacency if any.
+        :type rows: list
+        :param track: Whether to register the new objects in the identity map.
+        :type track: bool
+        :returns: The mapped objects, in the same order.
+        :rtype: list
+        """
+        if not self._eager:
+            return self._hydrate_all(rows, track)
+        objs = self._hydrate_all([row[0] for row in rows], track)
+        for obj, row in zip(objs, rows):
+            for name, adjacents in zip(self._eager, row[1:]):
+                self._fill_cache(obj, name, adjacents, track)
+        return objs
+
+
+    def _hydrate_all(self, results, track=True):
+        """ Maps a page of elements to objects at once. The model of each
+        element is resolved from its model name, the elements are grouped by
+        mapped class and built by the generated function of their class, then
+        the new objects are all registered in the identity map in one pass.
+
+        :param results: The elements, as returned by the database.
+        :type results: list<dict>
+        :param track: Whether to register the new objects in the identity map.
+        :type track: bool
+        :returns: The mapped objects, in the same order. Elements already
+        tracked are returned as they are, and elements of unmapped models are
+        left raw.
+        :rtype: list
+        """
+        identity_map = self.session.identity_map
+        objs = list(results)
+        groups = OrderedDict()
+        positions = {}
+        duplicates = []
+        mappings = {}
+        for position, result in enumerate(results):
+            if not isinstance(result, dict):
+                continue
+            obj = identity_map.get_by_id(result['_id'])
+            if obj is not None:
+                objs[position] = obj
+                continue
+            # The same element may come up several times in a page
+            if result['_id'] in positions:
+                duplicates.append((position, positions[result['_id']]))
+                continue
+            mapping = self._mapping(result, mappings)
+            if mapping is None:
+                continue
+            positions[result['_id']] = position
+            groups.setdefault(mapping, []).append(position)
+
+        loaded = []
+        for (model, class_), group in groups.iteritems():
+            hydrate = hydrator(model, class_)
+            for position in group:
+                obj, data = hydrate(results[position])
+                objs[position] = obj
+                loaded.append((obj, obj.id, data))
+        for position, first in duplicates:
+            objs[position] = objs[first]
+        if track:
+            identity_map.add_all(loaded)
+        return objs
+
+
+    def _mapping(self, result, mappings):
+        """ Resolves the model and class of an element from its model name.
+
+        :param result: The element, as returned by the database.
+        :type result: dict
+        :param mappings: The model and class already resolved, by model name.
+        :type mappings: dict
+        :returns: The model and class of the element, or None if its model is
+        not mapped.
+        :rtype: tuple
+        """
+        node = result.get('_type', None) != 'edge'
+        if node:
+            model_name = result.get(Node.model_name_storage_key, None)
+        else:
+            model_name = result.get('_label', None)
+
+        # Elements of the queried model are mapped to the queried class
+        if self.model is not None and self.class_ is not None \
+        and model_name in (None, self.model.model_name) \
+        and node == self.model.is_node():
+            return self.model, self.class_
+        if model_name is None:
+            return None
+
+        key = (node, model_name)
+        if key not in mappings:
+            metadata = self.session.metadata_map
+            try:
+                model = metadata.for_model_name(model_name, node)
+                mappings[key] = (model, metadata.for_model(model))
+            except Exception:
+                mappings[key] = None
+        return mappings[key]
+
+
+    def _fill_cache(self, obj, name, adjacents, track=True):
+        """ Stores the eagerly loaded relations of a node in its relation
+        cache.
+
+        :param obj: The node.
+        :type obj: object
+        :param name: The name of the adjacency.
+        :type name: str
+        :param adjacents: The edges of the adjacency, each with the node at its
+        other end.
+        :type adjacents: list<list>
+        :param track: Whether to register the new objects in the identity map.
+        :type track: bool
+        :returns: The relations, keyed by relationship.
+        :rtype: dict
+        """
+        metadata = self.session.metadata_map
+        adjacency = self.model._adjacencies[name]
+        relationship = adjacency.relationship
+        relationship_class = metadata.for_model(relationship)
+        relations = {}
+        for edge, vertex in adjacents:
+            model = metadata.for_model_name(vertex[self.model.model_name_storage_key])
+            node = self._hydrate(vertex, track, model, metadata.for_model(model))
+            relation = self._hydrate(edge, track, relationship, relationship_class)
+            if edge.get('_inV', None) == vertex['_id']:
+                relation.inV, relation.outV = node, obj
+            else:
+                relation.inV, relation.outV = obj, node
+            relations[relation] = node
+        setattr(obj, cache_name(adjacency.direction, relationship.model_name), relations)
+        return relations
+
+
+    def _root(self, row):
+        """ :returns: The queried element of a row, without its adjacencies.
+        :rtype: dict
+        """
+        if self._eager:
+            return row[0]
+        return row
+
+
+    def _hydrate(self, result, track=True, model=None, class_=None):
+        """ Maps an element returned by the database to an object. Elements
+        already tracked by the identity map are returned as they are.
+
+        :param result: The element, as returned by the database.
+        :type result: dict
+        :param track: Whether to register the new objects in the identity map.
+        :type track: bool
+        :param model: The model of the element, defaults to the queried one.
+        :type model: graphalchemy.blueprints.schema.Model
+        :param class_: The class the element is mapped to, defaults to the
+        queried one.
+        :type class_: object
+        :returns: The mapped object, or the raw element if the query is not
+        bound to a mapped class.
+        :rtype: object
+        """
+        if model is None:
+            model, class_ = self.model, self.class_
+        if class_ is None or not isinstance(result, dict):
+            return result
+        identity_map = self.session.identity_map
+        obj = identity_map.get_by_id(result['_id'])
+        if obj is not None:
+            return obj
+
+        obj, data = hydrator(model, class_)(result)
+        if track:
+            identity_map.add(obj, obj.id).update_attributes(data)
+        return obj
+
+
+    def _useful_indices(self, filters):
+        """ :returns: The indexed properties among the filters, from the most
+        selective to the least selective one.
+        :rtype: list
+        """
+        if self.model is None:
+            return []
+        properties = dict(
+            (self.model.indices[name].name_db, self.model.indices[name])
+            for name in self.model._useful_indices_among(filters)
+        )
+        keys = self.session.statistics.rank(self.model.model_name, properties.keys(), properties)
+        return [properties[key].name_py for key in keys]
+
+
+    def _useful_lookups(self, predicates):
+        """ :returns: The in predicates on indexed properties, from the one with
+        the fewest values to the one with the most.
+        :rtype: list<graphalchemy.blueprints.predicates.Predicate>
+        """
+        if self.model is None:
+            return []
+        lookups = [predicate for predicate in predicates
+                   if predicate.operator == 'in' and predicate.key in self.model.indices]
+        return sorted(lookups, key=lambda predicate: len(predicate.value))
+
+
+    def _useful_ranges(self, predicates):
+        """ :returns: The comparisons on indexed properties, bounded ones first.
+        :rtype: list<graphalchemy.blueprints.predicates.Predicate>
+        """
+        if self.model is None:
+            return []
+        ranges = [predicate for predicate in predicates
+                  if predicate.operator in ('lt', 'lte', 'gt', 'gte', 'between')
+                  and predicate.key in self.model.indices]
+        return sorted(ranges, key=lambda predicate: predicate.operator != 'between')
+
+
+    def _bind_predicate(self, predicate):
+        """ :returns: The parameter of a predicate, cast to the database type
+        of its property.
+        :rtype: mixed
+        """
+        if self.model is None or predicate.key not in self.model._properties:
+            return predicate.bind()
+        return predicate.bind(self.model._properties[predicate.key].to_db)
+
+
+    def _name_db(self, name):
+        """ :returns: The key of a property, as stored in the database.
+        :rtype: str
+        """
+        if self.model is None:
+            return name
+        if name not in self.model._properties:
+            raise Exception('Unknown property for '+str(self.model.model_name)+' : '+repr(name))
+        return self.model._properties[name].name_db
+
+
+    def _element_step(self):
+        if self.model is not None and self.model.is_relationship():
+            return u'E'
+        return u'V'
 
 
     def _log(self, message, level=10):
@@ -200,6 +1043,3 @@ class Query(object):
         if self.logger is not None:
             self.logger.log(level, message)
         return self
-
-
-
@@ -5,6 +5,7 @@
 #                                      IMPORTS
 # ==============================================================================
 
+from graphalchemy.ogm.hydration import hydrator
 from graphalchemy.ogm.query import Query
 
 
@@ -111,47 +112,59 @@ class Repository(object):
         self.session.add_to_identity_map(obj)
         return obj
 
-    def filter(self, **kwargs):
-        """ We have to pre-process the query here to use the right index.
+    def get_many(self, ids):
+        """ Retrieves several elements from their ids. The elements already
+        tracked by the identity map are served from memory, the others are all
+        fetched by a single request.
+
+        Example use :
+        >>> websites, missing = repository.get_many([123, 124, 125])
+
+        :param ids: The element ids.
+        :type ids: list
+        :returns: The objects found, in the order of the given ids, and the ids
+        that match no element of this repository.
+        :rtype: list, list
         """
-        query = Query(self.session)
-        # If one of the arguments is indexed, we use it first.
-        indices = self.model._useful_indices_among(kwargs)
-        if len(indices):
-            index_name = indices[0]
-            key = index_name
-            value = kwargs[index_name]
-            query.filter_on_index(index_name, key, value)
-            kwargs.pop(index_name)
-        # Else, we simply use the index on the model name.
-        else:
-            index_name = self.model.model_name_storage_key
-            key = index_name
-            value = self.model.model_name
-            query.filter_on_index()
-
-        query.filter(**kwargs)
-        return query
+        found = {}
+        fetched = []
+        seen = set()
+        for id in ids:
+            if id in seen:
+                continue
+            seen.add(id)
+            obj = self.session.identity_map.get_by_id(id)
+            if obj is None:
+                fetched.append(id)
+            elif isinstance(obj, self.class_):
+                found[id] = obj
+        self._log(str(len(found))+' objects found in entity map, '+str(len(fetched))+' to fetch')
+
+        if len(fetched):
+            for obj in self.filter().with_ids(fetched):
+                found[obj.id] = obj
+
+        objs = [found[id] for id in ids if id in found]
+        missing = [id for id in ids if id not in found]
+        return objs, missing
+
+
+    def filter(self, *predicates, **kwargs):
+        """ Builds a query over the elements of this repository. The index to
+        start from is chosen by the query itself.
 
+        Example use :
+        >>> pages = repository.filter(title=u'Lasagna').limit(10).all()
 
-    def _build_object(self, results):
-        obj = self.class_(results)
-        self._update_object(obj, results)
-        return obj
+        :returns: The query, that is not executed yet.
+        :rtype: graphalchemy.ogm.query.Query
+        """
+        query = Query(self.session, self.model, self.class_, logger=self.logger)
+        return query.filter(*predicates, **kwargs)
 
 
-    def _update_object(self, obj, results):
-        for property_db, value_db in results.iteritems():
-            found = False
-            for property in self.model._properties:
-                if property.name_db != property_db:
-                    continue
-                found = True
-                break
-            if not found:
-                raise Exception('Property retrieved but not found : '+property_db)
-            value_py = property.to_py(value_db)
-            setattr(obj, property.name_py, value_py)
+    def _build_object(self, results):
+        obj, data = hydrator(self.model, self.class_)(results)
         return obj
 
 
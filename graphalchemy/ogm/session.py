@@ -1,27 +1,81 @@
+from collections import OrderedDict
 
+from graphalchemy.blueprints.statistics import IndexStatistics
 from graphalchemy.ogm.identity import IdentityMap
 from graphalchemy.ogm.unitofwork import UnitOfWork
-from graphalchemy.ogm.state import InstanceState
+from graphalchemy.ogm.plan import FlushPlan
+from graphalchemy.ogm.workers import WorkerPool
 
 class Session(object):
 
-    def __init__(self, client, metadata, logger=None):
-        self.identity_map = IdentityMap()
+    def __init__(self, client, metadata, logger=None, chunk_size=None, weak_identity_map=False, identity_map_size=None, batch_size=None, autoflush_threshold=None, client_factory=None, statistics=None):
+        self.identity_map = IdentityMap(weak=weak_identity_map, max_size=identity_map_size)
         self.metadata_map = metadata
         self.client = client
+        # Builds the clients of the worker threads of parallel flushes
+        if client_factory is None:
+            client_factory = lambda: client.__class__(client.config)
+        self.client_factory = client_factory
         self.logger = logger
+        # Selectivity of the indexed keys, used to pick the index of queries
+        if statistics is None:
+            statistics = IndexStatistics(logger=logger)
+        self.statistics = statistics
+        self.chunk_size = chunk_size
+        # Maximum number of objects per unit of work, None for no limit
+        self.batch_size = batch_size
+        # Number of pending objects that triggers a flush, None to disable
+        self.autoflush_threshold = autoflush_threshold
+        # Number of new relationships left pending by the last flush, because
+        # their endpoints could not be resolved
+        self._deferred = 0
 
-        self._update = []
-        self._delete = []
-        self._new = []
+        # Pending objects, keyed by identity, in insertion order
+        self._delete = OrderedDict()
+        self._new = OrderedDict()
+
+        # Number of elements removed by the last flush, for reporting purposes
+        self.last_deleted_count = 0
 
 
     def add(self, instance):
         if instance in self.identity_map:
-            self._update.append(instance)
+            # Pending changes must survive until the flush
+            self.identity_map.mark_dirty(instance)
+        elif getattr(instance, 'id', None) is not None:
+            # Persisted objects the identity map let go of are updated in full
+            self._attach(instance)
         else:
-            self._new.append(instance)
-        return self
+            self._new[id(instance)] = instance
+        self._delete.pop(id(instance), None)
+        return self._autoflush()
+
+
+    def delete(self, instance):
+        # Objects that were never flushed are simply forgotten
+        if self._new.pop(id(instance), None) is not None:
+            return self
+        if instance in self.identity_map:
+            self.identity_map.mark_clean(instance)
+        self._delete[id(instance)] = instance
+        return self._autoflush()
+
+
+    def _attach(self, instance):
+        """ Tracks again a persisted object that the identity map released.
+        Its values in the database are unknown, so that all its properties are
+        considered modified.
+
+        :param instance: The persisted object.
+        :type instance: object
+        :returns: The state of the object.
+        :rtype: graphalchemy.ogm.state.InstanceState
+        """
+        state = self.identity_map.add(instance, instance.id)
+        for property in self.metadata_map.for_object(instance)._properties_ordered:
+            state.modified.add(property.name_py)
+        self.identity_map.mark_dirty(instance)
+        return state
 
 
     def get_vertex(self, id):
@@ -32,58 +86,229 @@ class Session(object):
 
 
     def add_to_identity_map(self, obj):
-        # Add to the identity_map
-        self.identity_map[obj] = InstanceState(obj)
-        self.identity_map[obj].update_id(id)
+        # Add to the identity_map, indexed by id
+        self.identity_map.add(obj, obj.id)
         # self.identity_map[obj].update_attributes(data)
         return self
 
 
     def clear(self):
         self.identity_map.clear()
-        self._update = []
-        self._delete = []
-        self._new = []
+        self._delete = OrderedDict()
+        self._new = OrderedDict()
+        self._deferred = 0
+        return self
+
+
+    def flush(self, batch_size=None, workers=None):
+        """ Sends the pending changes to the database.
+
+        By default, everything is sent by a single unit of work. With a
+        batch_size, the changes are sent by successive units of work of at most
+        batch_size objects each : the objects of a chunk are released by the
+        session as soon as the chunk is flushed, and a failure only leaves the
+        remaining chunks pending.
+
+        Given a number of workers, each unit of work is split by model and by
+        chunk, and the chunks are sent concurrently by a pool of threads : node
+        chunks first, then relationship chunks once the ids of their endpoints
+        are known, then updates and deletes. The outcome is the same as the one
+        of a serial flush.
+
+        :param batch_size: The maximum number of objects per unit of work, or
+        None to use the default batch size of the session.
+        :type batch_size: int
+        :param workers: The number of threads sending the requests, or None to
+        send them serially.
+        :type workers: int
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.session.Session
+        """
+        if workers is None:
+            return self._flush(batch_size, defer_unresolved=False)
+        pool = WorkerPool(self.client_factory, workers, chunk_size=self.chunk_size, logger=self.logger)
+        try:
+            return self._flush(batch_size, defer_unresolved=False, pool=pool)
+        finally:
+            pool.close()
+
+
+    def _flush(self, batch_size, defer_unresolved, pool=None):
+        """ Flushes the pending changes, chunk by chunk.
+
+        :param batch_size: The maximum number of objects per unit of work.
+        :type batch_size: int
+        :param defer_unresolved: Whether the new relationships whose endpoints
+        cannot be resolved yet are kept pending instead of failing the flush.
+        :type defer_unresolved: bool
+        :param pool: The workers to send the requests through, if any.
+        :type pool: graphalchemy.ogm.workers.WorkerPool
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.session.Session
+        """
+        plan = self._plan(batch_size, defer_unresolved)
+        operations = plan.operations()
+        batch_size = plan.batch_size or max(len(operations), 1)
+        del plan
+
+        self.last_deleted_count = 0
+        for start in xrange(0, len(operations), batch_size):
+            chunk = operations[start:start+batch_size]
+
+            # Nothing is evicted until the chunk is flushed and settled
+            with self.identity_map.hold_eviction():
+                uow = UnitOfWork(self.client, self.identity_map, self.metadata_map, logger=self.logger, chunk_size=self.chunk_size)
+                for obj, state in chunk:
+                    uow.register_object(obj, state)
+                uow.execute(pool)
+                self.last_deleted_count += uow.deleted
+
+                # Flushed objects are only tracked by the identity map from now on
+                for obj, state in chunk:
+                    if state == 'new':
+                        del self._new[id(obj)]
+                    elif state == 'update':
+                        self.identity_map.mark_clean(obj)
+                    else:
+                        del self._delete[id(obj)]
+                    self._log(state.capitalize()+" flushed : "+str(obj))
+
+            # Release the chunk before building the next one
+            operations[start:start+batch_size] = [None] * len(chunk)
+            del chunk, uow
+
+        # Only deferred relationships can be left pending
+        self._deferred = len(self._new)
+        self._log("Deleted "+str(self.last_deleted_count)+" elements")
         return self
 
 
-    def flush(self):
-
-        uow = UnitOfWork(self.client, self.identity_map, self.metadata_map, logger=self.logger)
-
-        # We need to save nodes first
-        for obj in self._new:
-            if self.metadata_map.is_node(obj):
-                uow.register_object(obj, 'new')
-                self._log("Inserted "+str(obj))
-        for obj in self._new:
-            if self.metadata_map.is_relationship(obj):
-                uow.register_object(obj, 'new')
-                self._log("Inserted "+str(obj))
-
-        # Update all other nodes
-        for obj in self._update:
-            if self.metadata_map.is_node(obj):
-                uow.register_object(obj, 'update')
-                self._log("Updated "+str(obj))
-        for obj in self._update:
-            if self.metadata_map.is_relationship(obj):
-                uow.register_object(obj, 'update')
-                self._log("Updated "+str(obj))
-
-        # We need to delete relations first
-        for obj in self._delete:
-            if self.metadata_map.is_relationship(obj):
-                uow.register_object(obj, 'delete')
-                self._log("Deleted "+str(obj))
-        for obj in self._delete:
-            if self.metadata_map.is_node(obj):
-                uow.register_object(obj, 'delete')
-                self._log("Deleted "+str(obj))
+    def plan(self, batch_size=None):
+        """ Sorts the pending changes in dependency order, without sending
+        anything to the database.
+
+        :param batch_size: The maximum number of objects per unit of work, or
+        None to use the default batch size of the session.
+        :type batch_size: int
+        :returns: The plan of the next flush.
+        :rtype: graphalchemy.ogm.plan.FlushPlan
+        """
+        return self._plan(batch_size)
+
+
+    def explain_flush(self, batch_size=None):
+        """ Describes what the next flush will send, without contacting the
+        database : the inserted, updated and deleted objects, the number of
+        requests and the size of their payloads.
+
+        Example use :
+        >>> explanation = session.explain_flush(batch_size=1000)
+        >>> explanation['requests'], explanation['bytes']
+        (12, 304211)
+
+        :param batch_size: The maximum number of objects per unit of work, or
+        None to use the default batch size of the session.
+        :type batch_size: int
+        :returns: The explanation, as described by FlushPlan.explain.
+        :rtype: dict
+        """
+        return self._plan(batch_size).explain()
+
+
+    def _plan(self, batch_size, defer_unresolved=False):
+        """ Sorts the pending changes in dependency order.
+
+        :param batch_size: The maximum number of objects per unit of work.
+        :type batch_size: int
+        :param defer_unresolved: Whether to leave out the new relationships
+        whose endpoints are neither persisted nor pending.
+        :type defer_unresolved: bool
+        :returns: The plan of the flush.
+        :rtype: graphalchemy.ogm.plan.FlushPlan
+        """
+        if batch_size is None:
+            batch_size = self.batch_size
+        if batch_size is not None and batch_size < 1:
+            raise Exception('Batch size must be strictly positive.')
+
+        plan = FlushPlan(self.metadata_map, self.identity_map, chunk_size=self.chunk_size, batch_size=batch_size)
+        for obj in self._new.itervalues():
+            if defer_unresolved and self.metadata_map.is_relationship(obj) \
+            and not self._is_resolvable(obj):
+                continue
+            plan.add(obj, 'new')
+        # Instrumented attributes flag the tracked objects they modify, so
+        # only those are visited, along with the ones changed in place.
+        self._flag_mutated()
+        for obj in self.identity_map.dirty:
+            plan.add(obj, 'update')
+        for obj in self._delete.itervalues():
+            plan.add(obj, 'delete')
+        return plan
 
+
+    def _flag_mutated(self):
+        """ Flags the clean tracked objects whose mutable properties, such as
+        lists and dicts, were changed in place : such changes do not go
+        through the instrumented attributes. Only the objects of models that
+        have mutable properties are compared with their flushed values.
+
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.session.Session
+        """
+        mutables = {}
+        for obj, state in list(self.identity_map.iteritems()):
+            class_ = obj.__class__
+            properties = mutables.get(class_, None)
+            if properties is None:
+                properties = mutables[class_] = self.metadata_map.for_class(class_)._properties_mutable
+            if not properties or self.identity_map.is_dirty(obj):
+                continue
+            for property in properties:
+                value = property.to_db(getattr(obj, property.name_py, None))
+                if state._attributes.get(property.name_db, None) != value:
+                    state.modify(property.name_py)
         return self
 
 
+    def _is_resolvable(self, obj):
+        """ :returns: Whether both endpoints of a new relationship will have an
+        id once the pending nodes are flushed.
+        :rtype: bool
+        """
+        for endpoint in ('outV', 'inV'):
+            vertex = getattr(obj, endpoint, None)
+            if vertex is None:
+                return False
+            if isinstance(vertex, (int, long, basestring)):
+                continue
+            if vertex not in self.identity_map and id(vertex) not in self._new:
+                return False
+        return True
+
+
+    def _autoflush(self):
+        """ Flushes the session once the number of pending objects reaches the
+        autoflush threshold, so that long imports run in bounded memory.
+
+        The relationships deferred by the previous flush are not counted, and
+        the session waits for at least as many new pending objects as there
+        are deferred relationships : relationships whose endpoints never get
+        added cost a logarithmic number of flush plans, instead of one per
+        added object.
+
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.session.Session
+        """
+        if self.autoflush_threshold is None:
+            return self
+        pending = len(self._new) + len(self._delete) - self._deferred
+        if pending < max(self.autoflush_threshold, self._deferred):
+            return self
+        self._log("Autoflush threshold reached")
+        return self._flush(None, defer_unresolved=True)
+
+
     def _log(self, message, level=10):
         if self.logger is None:
             return self
@@ -1,3 +1,4 @@
+import copy
 import weakref
 
 class InstanceState(object):
@@ -11,6 +12,10 @@ class InstanceState(object):
         self.state = self.ADD
         self.id = None
         self._attributes = {}
+        # Attributes assigned since the last synchronization with the database
+        self.modified = set()
+        # Weak reference to the identity map tracking the object
+        self.identity_map = None
         
     def update_id(self, _id):
         if self.id is not None and _id != self.id:
@@ -20,6 +25,26 @@ class InstanceState(object):
     
     def update_attributes(self, _attributes):
         self._attributes.update(_attributes)
+        # Mutable values are shared with the object : keep a copy, so that
+        # changes made in place can be told apart
+        for attribute, value in _attributes.iteritems():
+            if type(value) in (list, dict):
+                self._attributes[attribute] = copy.deepcopy(value)
+    
+    def modify(self, attribute):
+        self.modified.add(attribute)
+        if self.identity_map is None:
+            return self
+        identity_map = self.identity_map()
+        obj = self.obj()
+        if identity_map is not None and obj is not None:
+            identity_map.mark_dirty(obj)
+        return self
+    
+    def commit(self, _attributes):
+        self.update_attributes(_attributes)
+        self.modified.clear()
+        return self
         
     def attribute_has_changed(self, attribute, value):
         if attribute not in self._attributes:
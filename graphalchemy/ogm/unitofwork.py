@@ -1,69 +1,315 @@
-from graphalchemy.ogm.state import InstanceState
+from collections import OrderedDict
+
+from graphalchemy.ogm.bulk import BulkWriter
+from graphalchemy.ogm.hydration import dehydrator
+
+
+def changes(obj, identity, class_meta):
+    """ Computes the properties of a tracked object that differ from the values
+    last flushed. Only the assigned properties are visited, along with the
+    mutable ones that can change in place.
+
+    :param obj: The tracked object.
+    :type obj: object
+    :param identity: The state of the object.
+    :type identity: graphalchemy.ogm.state.InstanceState
+    :param class_meta: The model of the object.
+    :type class_meta: graphalchemy.blueprints.schema.Model
+    :returns: The changed values, as they must be stored in the database.
+    :rtype: dict
+    """
+    data = {}
+    for property in class_meta._properties_ordered:
+        if property.name_py not in identity.modified \
+        and not property.mutable:
+            continue
+        python_value = getattr(obj, property.name_py)
+        property.validate(python_value)
+        db_value = property.to_db(python_value)
+        if identity.attribute_has_changed(property.name_db, db_value):
+            data[property.name_db] = db_value
+    return data
+
+
+def insert_data(obj, class_meta):
+    """ Computes the properties of a new object, as they must be stored in the
+    database. Edges store their model name as their label, while nodes store it
+    as a property.
+
+    :param obj: The new object.
+    :type obj: object
+    :param class_meta: The model of the object.
+    :type class_meta: graphalchemy.blueprints.schema.Model
+    :returns: The values to insert.
+    :rtype: dict
+    """
+    return dehydrator(class_meta, obj.__class__)(obj)
 
 
 class UnitOfWork(object):
 
-    def __init__(self, client, identity_map, metadata_map, logger=None):
+    def __init__(self, client, identity_map, metadata_map, logger=None, chunk_size=None):
         self.client = client
         self.identity_map = identity_map
         self.metadata_map = metadata_map
         self.logger = logger
+        self.writer = BulkWriter(client, chunk_size=chunk_size, logger=logger)
+
+        # Inserts are delayed until execute() in order to be sent in batches
+        self._node_inserts = []
+        self._relationship_inserts = []
+        self._updates = []
+        self._node_deletes = []
+        self._relationship_deletes = []
+
+        # Number of elements actually removed by the last execution
+        self.deleted = 0
 
 
     def register_object(self, obj, state):
 
-        if state == 'new':
+        if state in ('new', 'update'):
 
             class_meta = self.metadata_map.for_object(obj)
 
+            # Persisted objects are updated in full, never inserted again
+            if obj not in self.identity_map and getattr(obj, 'id', None) is not None:
+                self._log("Already persisted : updating "+str(obj.id))
+                self.identity_map.add(obj, obj.id)
+                data = insert_data(obj, class_meta)
+                self._updates.append((obj, data))
+                return
+
             if obj in self.identity_map:
                 identity = self.identity_map[obj]
 
                 self._log("Found in identity map : updating "+str(identity.id))
-                # Get data to update
-                data = {}
-                for property in class_meta._properties:
-                    python_value = getattr(obj, property.name_py)
-                    property.validate(python_value)
-                    if identity.attribute_has_changed(property.name_py, python_value):
-                        data[property.name_db] = property.to_db(python_value)
-                        self._log('  Property '+str(property)+' changed to '+str(python_value)+', updating.')
-                    else:
-                        self._log('  Property '+str(property)+' has not changed.')
-
-                # Update
+                data = changes(obj, identity, class_meta)
+                for name_db in data:
+                    self._log('  Property '+name_db+' changed, updating.')
+
+                # Updates are delayed until execute() as well
                 if len(data):
-                    response = self.client.update_vertex(identity.id, data)
-                    self._log("Updated "+str(identity.id))
+                    self._updates.append((obj, data))
                 else:
                     self._log("Nothing to update in "+str(identity.id))
+                    identity.commit(data)
 
             else:
-                self._log("Not found in identity map : inserting.")
+                self._log("Not found in identity map : scheduling insert.")
+
+                data = insert_data(obj, class_meta)
+                if class_meta.is_relationship():
+                    self._relationship_inserts.append((obj, data))
+                else:
+                    self._node_inserts.append((obj, data))
+
+        elif state == 'delete':
+
+            # Objects that were never persisted have nothing to delete
+            if obj in self.identity_map:
+                id = self.identity_map[obj].id
+            else:
+                id = getattr(obj, 'id', None)
+            if id is None:
+                self._log("Not persisted : nothing to delete.")
+                return
+
+            self._log("Scheduling delete of "+str(id))
+            if self.metadata_map.is_relationship(obj):
+                self._relationship_deletes.append((obj, id))
+            else:
+                self._node_deletes.append((obj, id))
+
+
+    def execute(self, pool=None):
+        """ Sends the scheduled writes to the database, one request per chunk,
+        then fills the identity map with the returned ids in a single pass.
+
+        Nodes are inserted first, so that the relationships of the same flush
+        can be bound to the ids freshly assigned to their endpoints. Updates
+        follow, and deletes come last : the number of removed elements is stored
+        in the deleted attribute.
+
+        Given a pool of workers, each stage is split by model and by chunk, and
+        the chunks of a stage are sent concurrently. The identity map is only
+        filled by the calling thread, once a stage is complete.
+
+        :param pool: The workers to send the requests through, or None to send
+        them serially through the client of the unit of work.
+        :type pool: graphalchemy.ogm.workers.WorkerPool
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.unitofwork.UnitOfWork
+        """
+        if len(self._node_inserts):
+            datas = [data for obj, data in self._node_inserts]
+            ids = self._scatter(pool, self._node_inserts, datas,
+                lambda writer, chunk: writer.create_vertices(chunk))
+            self._register_inserts(self._node_inserts, ids)
+            self._node_inserts = []
+
+        if len(self._relationship_inserts):
+            edges = []
+            for obj, data in self._relationship_inserts:
+                edges.append({
+                    'outV': self._endpoint_id(obj, 'outV'),
+                    'inV': self._endpoint_id(obj, 'inV'),
+                    'label': self.metadata_map.for_object(obj).model_name,
+                    'data': data
+                })
+            ids = self._scatter(pool, self._relationship_inserts, edges,
+                lambda writer, chunk: writer.create_edges(chunk))
+            self._register_inserts(self._relationship_inserts, ids)
+            self._relationship_inserts = []
+
+        if len(self._updates):
+            updates = [(self.identity_map[obj].id, data, self.metadata_map.is_relationship(obj)) for obj, data in self._updates]
+            self._scatter(pool, self._updates, updates, self._send_updates)
+            for obj, data in self._updates:
+                self.identity_map[obj].commit(data)
+            self._updates = []
+
+        # Deletes are grouped by type : relationships go first
+        self.deleted = 0
+        if len(self._relationship_deletes) or len(self._node_deletes):
+            if pool is None:
+                self.deleted = self.writer.delete(
+                    [id for obj, id in self._relationship_deletes],
+                    [id for obj, id in self._node_deletes]
+                )
+            else:
+                for deletes, edges in [(self._relationship_deletes, True), (self._node_deletes, False)]:
+                    ids = [id for obj, id in deletes]
+                    partitions = self._partition(deletes)
+                    counts = pool.map(lambda writer, indices: writer.delete(
+                        [ids[i] for i in indices] if edges else [],
+                        [] if edges else [ids[i] for i in indices]
+                    ), partitions)
+                    self.deleted += sum(counts)
+            self._log('Deleted '+str(self.deleted)+' elements')
+            # Deleted objects are not persisted anymore : adding them again
+            # inserts them
+            for obj, id in self._relationship_deletes + self._node_deletes:
+                self.identity_map.pop(obj, None)
+                obj.id = None
+            self._relationship_deletes = []
+            self._node_deletes = []
+
+        return self
+
+
+    def _scatter(self, pool, objs, items, send):
+        """ Sends items through a function, at once or in one task per model and
+        per chunk if a pool of workers is given.
+
+        :param pool: The workers to send the requests through, or None.
+        :type pool: graphalchemy.ogm.workers.WorkerPool
+        :param objs: The objects the items were computed from, along with their
+        data.
+        :type objs: list<tuple>
+        :param items: The items to send.
+        :type items: list
+        :param send: Sends a list of items through a bulk writer, and returns
+        one result per item.
+        :type send: callable
+        :returns: The results, in the same order as the items.
+        :rtype: list
+        """
+        if pool is None:
+            return send(self.writer, items)
+        partitions = self._partition(objs)
+        results = [None] * len(items)
+        chunks = pool.map(lambda writer, indices: send(writer, [items[i] for i in indices]), partitions)
+        for indices, chunk in zip(partitions, chunks):
+            if len(chunk) != len(indices):
+                raise Exception('Expected '+str(len(indices))+' results, got '+str(len(chunk)))
+            for index, result in zip(indices, chunk):
+                results[index] = result
+        return results
+
+
+    def _partition(self, objs):
+        """ Splits objects by model, then in chunks.
+
+        :param objs: The objects, along with their data.
+        :type objs: list<tuple>
+        :returns: The positions of the objects, for each chunk.
+        :rtype: list<list>
+        """
+        groups = OrderedDict()
+        for index, (obj, data) in enumerate(objs):
+            model_name = self.metadata_map.for_object(obj).model_name
+            groups.setdefault(model_name, []).append(index)
+        chunk_size = self.writer.chunk_size
+        partitions = []
+        for indices in groups.itervalues():
+            for start in xrange(0, len(indices), chunk_size):
+                partitions.append(indices[start:start+chunk_size])
+        return partitions
+
+
+    def _send_updates(self, writer, updates):
+        """ Sends the updates, one request per element.
+
+        :param writer: The writer whose client sends the requests.
+        :type writer: graphalchemy.ogm.bulk.BulkWriter
+        :param updates: The id, the changed values, and whether the element is
+        an edge, for each element.
+        :type updates: list<tuple>
+        :returns: The responses.
+        :rtype: list
+        """
+        responses = []
+        for id, data, is_relationship in updates:
+            if is_relationship:
+                responses.append(writer.client.update_edge(id, data))
+            else:
+                responses.append(writer.client.update_vertex(id, data))
+            self._log("Updated "+str(id))
+        return responses
+
+
+    def _register_inserts(self, inserts, ids):
+        """ Binds the inserted objects to their new ids in the identity map.
 
-                # Get data to update
-                data = {}
-                for property in class_meta._properties:
-                    self._log('  Property '+str(property)+' is new.')
-                    python_value = getattr(obj, property.name_py)
-                    property.validate(python_value)
-                    data[property.name_db] = property.to_db(python_value)
-                data[class_meta.model_name_storage_key] = class_meta.model_name
+        :param inserts: The inserted objects, with the data they were saved with.
+        :type inserts: list<tuple>
+        :param ids: The ids returned by the database, in the same order.
+        :type ids: list
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.unitofwork.UnitOfWork
+        """
+        for (obj, data), id in zip(inserts, ids):
+            self._log('Inserted '+str(obj)+' : property id updated to '+str(id))
+            obj.id = id
+            state = self.identity_map.add(obj, id)
+            state.update_attributes(data)
+        return self
 
-                # Insert
-                response = self.client.create_vertex(data)
 
-                # Update identity map
-                id = response.content['results']['_id']
-                self._log('  Property '+str('id')+' updated to '+str(id))
-                obj.id = id
-                self.identity_map[obj] = InstanceState(obj)
-                self.identity_map[obj].update_id(id)
-                self.identity_map[obj].update_attributes(data)
+    def _endpoint_id(self, obj, endpoint):
+        """ Resolves the id of one endpoint of a relationship. The endpoint can
+        be given as a raw id, or as a mapped object that is already persisted,
+        including by the current flush.
 
+        :param obj: The relationship.
+        :type obj: object
+        :param endpoint: The attribute holding the endpoint (outV or inV).
+        :type endpoint: str
+        :returns: The id of the endpoint in the database.
+        :rtype: mixed
+        """
+        vertex = getattr(obj, endpoint, None)
+        if vertex is None:
+            raise Exception('Vertex '+endpoint+' not set on '+str(obj))
+        if isinstance(vertex, (int, long, basestring)):
+            return vertex
+        if vertex not in self.identity_map:
+            raise Exception('Vertex '+endpoint+' of '+str(obj)+' is not persisted.')
+        return self.identity_map[vertex].id
 
 
     def _log(self, message, level=10):
         if self.logger is None:
             return self
-        self.logger.log(level, message)
\ No newline at end of file
+        self.logger.log(level, message)
@@ -0,0 +1,73 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+#                                      IMPORTS
+# ==============================================================================
+
+from multiprocessing.pool import ThreadPool
+import threading
+
+from graphalchemy.ogm.bulk import BulkWriter
+
+
+# ==============================================================================
+#                                     SERVICE
+# ==============================================================================
+
+class WorkerPool(object):
+    """ Threads sending requests concurrently. The HTTP connection of a client
+    cannot be shared between threads, so each thread writes through its own
+    client, built once by the client factory.
+
+    Example use :
+    >>> pool = WorkerPool(client_factory, workers=8)
+    >>> ids = pool.map(lambda writer, datas: writer.create_vertices(datas), chunks)
+    >>> pool.close()
+    """
+
+    def __init__(self, client_factory, workers, chunk_size=None, logger=None):
+        """ Starts the threads.
+
+        :param client_factory: Builds a new client.
+        :type client_factory: callable
+        :param workers: The number of threads.
+        :type workers: int
+        :param chunk_size: The maximum number of elements per request.
+        :type chunk_size: int
+        :param logger: An optionnal logger.
+        :type logger: logging.Logger
+        """
+        if workers < 1:
+            raise Exception('Number of workers must be strictly positive.')
+        self._local = threading.local()
+        self.pool = ThreadPool(workers, self._initialize, (client_factory, chunk_size, logger))
+
+
+    def map(self, func, tasks):
+        """ Runs a function once per task, concurrently.
+
+        :param func: The function, called with the writer of the thread and the
+        task.
+        :type func: callable
+        :param tasks: The tasks.
+        :type tasks: list
+        :returns: The results, in the same order as the tasks.
+        :rtype: list
+        """
+        return self.pool.map(lambda task: func(self._local.writer, task), tasks)
+
+
+    def close(self):
+        """ Stops the threads.
+
+        :returns: This object itself.
+        :rtype: graphalchemy.ogm.workers.WorkerPool
+        """
+        self.pool.close()
+        self.pool.join()
+        return self
+
+
+    def _initialize(self, client_factory, chunk_size, logger):
+        self._local.writer = BulkWriter(client_factory(), chunk_size=chunk_size, logger=logger)
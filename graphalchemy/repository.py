@@ -10,6 +10,9 @@ from bulbs.model import NodeProxy
 from bulbs.model import RelationshipProxy
 
 from graphalchemy.metadata import BulbsMetadata
+from graphalchemy.blueprints.predicates import Predicate
+from graphalchemy.blueprints.predicates import quote_key
+from graphalchemy.blueprints.statistics import IndexStatistics
 
 # ==============================================================================
 #                               IMPLEMENTATION
@@ -108,7 +111,10 @@ class BulbsNodeRepository(NodeProxy): # NodeProxy):
     >>> websites = repository.filter(name="FoodNetwork", domain="http://www.foodnetowrk.com")
     """
     
-    def __init__(self, element_class, client, graph=None, logger=None):
+    # Gremlin query strings, keyed by query shape, shared by all repositories
+    _query_filters = {}
+    
+    def __init__(self, element_class, client, graph=None, logger=None, statistics=None):
         """ Initializes the repository with the bulbs proxy and our metadata.
         
         :param graph: Bulbs graph object.
@@ -119,8 +125,14 @@ class BulbsNodeRepository(NodeProxy): # NodeProxy):
         :type metadata: graphalchemy.metadata.GraphMetadata
         :param logger: Optional logger to listen on queries.
         :type logger: jerome.application.service.logger.LoggerInterface
+        :param statistics: Selectivity of the indices, used to pick the one
+        to start queries from.
+        :type statistics: graphalchemy.blueprints.statistics.IndexStatistics
         """
         self.graph = graph
+        if statistics is None:
+            statistics = IndexStatistics(logger=logger)
+        self.statistics = statistics
         if hasattr(element_class, 'element_type'):
             repository_name = str(element_class.element_type)
         else: 
@@ -166,7 +178,7 @@ class BulbsNodeRepository(NodeProxy): # NodeProxy):
         return self.create(*args, **kwargs)
         
         
-    def filter(self, **kwargs):
+    def filter(self, *predicates, **kwargs):
         """ Performs a filtering operation on the given repository. Automaticaly
         decides which index to use : 
         - the eid index if provided
@@ -177,6 +189,7 @@ class BulbsNodeRepository(NodeProxy): # NodeProxy):
         >>> iterator = repository.filter(domain='http://www.foo.com', name='Foo')
         >>> iterator = repository.filter(eid=123)
         >>> iterator = repository.filter(indexed_property='Foo')
+        >>> iterator = repository.filter(Predicate('timeTotal', 'lt', 30))
         
         @todo : it should return an iterator and wait for extra filtering.
         @todo : only limited to filtering on one entity for now.
@@ -184,43 +197,81 @@ class BulbsNodeRepository(NodeProxy): # NodeProxy):
         :returns: generator -- The list of models that match the query.
         """
         # return self.base_repository.index.lookup(**kwargs)
-        groovy, params = self._build_query_filter(**kwargs)
+        groovy, params = self._build_query_filter(*predicates, **kwargs)
         self._log(groovy+u', '+unicode(params))
         return self.graph.gremlin.query(groovy, params)
         
         
-    def _build_query_filter(self, **kwargs):
+    def _build_query_filter(self, *predicates, **kwargs):
         """ Builds a gremlin query string from a set of filtering arguments.
-        @todo : no escaping is implemented yet.
+        The values are bound as parameters, so the string only depends on the
+        filtering keys, the operators of the predicates and the chosen index :
+        it is built once per shape.
         
         :returns: string, dict -- The gremlin query.
         """
         params = {}
         # If the value is in the parameters :
         if 'eid' in kwargs:
-            groovy = u'g.v(eid)'
+            index = u'eid'
             params['eid'] = int(kwargs['eid'])
             del kwargs['eid']
         else:
         # If one of the parameters is indexed :
             useful_indices = self._get_index_among(kwargs.keys())
             if useful_indices:
-                key = useful_indices[0]
-                groovy = u'g.V("'+unicode(key)+'", '+unicode(key)+u')'
-                params[unicode(key)] = kwargs[key]
-                del kwargs[key]
+                index = unicode(self.statistics.most_selective(self.name, useful_indices))
+                params[index] = kwargs[index]
+                del kwargs[index]
         # If no parameter is indexed :
             else:
-                groovy = u'g.V'
+                index = None
                 
         # Fillup with remaining
-        for key, val in kwargs.iteritems():
-            groovy = groovy+u'.has("'+unicode(key)+u'", '+unicode(key)+u')'
-            params[unicode(key)] = val
+        keys = tuple(sorted(unicode(key) for key in kwargs))
+        for key in keys:
+            params[key] = kwargs[key]
             
+        # Then with the predicates, bound by position
+        comparisons = []
+        for position, predicate in enumerate(predicates):
+            comparisons.append((unicode(predicate.key), predicate.operator))
+            params[u'q'+unicode(position)] = predicate.bind()
+            
+        shape = (index, keys, tuple(comparisons))
+        groovy = self._query_filters.get(shape, None)
+        if groovy is None:
+            groovy = self._query_filters[shape] = self._build_query_groovy(index, keys, comparisons)
         return groovy, params
         
         
+    def _build_query_groovy(self, index, keys, comparisons=()):
+        """ Builds the gremlin query string of a query shape.
+        
+        :param index: The indexed key to start from, eid, or None.
+        :type index: unicode
+        :param keys: The remaining keys to filter on.
+        :type keys: tuple
+        :param comparisons: The key and operator of each predicate.
+        :type comparisons: tuple
+        Keys are written in the script, as quoted names and as the names of
+        their parameters : quote_key rejects anything but plain names.
+        
+        :returns: unicode -- The gremlin query.
+        """
+        if index == u'eid':
+            groovy = u'g.v(eid)'
+        elif index is not None:
+            groovy = u'g.V('+quote_key(index)+u', '+index+u')'
+        else:
+            groovy = u'g.V'
+        for key in keys:
+            groovy = groovy+u'.has('+quote_key(key)+u', '+key+u')'
+        for position, (key, operator) in enumerate(comparisons):
+            groovy = groovy+Predicate.step(key, operator, u'q'+unicode(position))
+        return groovy
+        
+        
     def _get_index(self):
         """ Returns the list of indices for the current repository.
         
@@ -12,6 +12,9 @@ from graphalchemy.blueprints.validation import Validator
 
 # Model
 from graphalchemy.blueprints.schema import MetaData
+from graphalchemy.blueprints.schema import Node
+from graphalchemy.blueprints.schema import Property
+from graphalchemy.blueprints.types import String
 
 # Fixtures
 from graphalchemy.fixture.declarative import Website
@@ -46,3 +49,31 @@ class MetadataTestCase(TestCase):
         self.assertFalse(metadata.is_node(WebsiteHostsPage()))
         self.assertTrue(metadata.is_relationship(WebsiteHostsPage()))
         self.assertTrue(metadata.is_bind(WebsiteHostsPage()))
+
+
+
+class ModelTestCase(TestCase):
+
+    def test_add_property(self):
+        user = Node('User', MetaData(),
+            Property('lastname', String(), name_db='name'),
+            Property('firstname', String(), prefix=True)
+        )
+
+        # Properties are looked up by name in Python, or in the database
+        self.assertIs(user._properties['lastname'], user._properties_db['name'])
+        self.assertIs(user._properties['firstname'], user._properties_db['User_firstname'])
+        self.assertEquals(['lastname', 'firstname'], [prop.name_py for prop in user._properties_ordered])
+
+        # Tables are replaced, never modified in place
+        properties_db = user._properties_db
+        user.add_property(Property('email', String()))
+        self.assertEquals(2, len(properties_db))
+        self.assertEquals(3, len(user._properties_ordered))
+        self.assertRaises(Exception, user.add_property, Property('login', String(), name_db='email'))
+
+        # Tables cannot be modified but through add_property
+        self.assertRaises(Exception, user._properties.__setitem__, 'login', Property('login', String()))
+        self.assertRaises(Exception, user._properties.pop, 'email')
+        self.assertRaises(Exception, user._properties_db.update, {})
+        self.assertEquals(3, len(user._properties))
@@ -0,0 +1,64 @@
+#! /usr/bin/env python
+#-*- coding: utf-8 -*-
+
+# ==============================================================================
+#                                      IMPORTS
+# ==============================================================================
+
+from unittest import TestCase
+
+from mock import Mock
+
+# Services to test
+from graphalchemy.blueprints.statistics import IndexStatistics
+
+# Model
+from graphalchemy.blueprints.schema import Property
+from graphalchemy.blueprints.types import Boolean
+from graphalchemy.blueprints.types import Url
+
+# Fixtures
+from graphalchemy.fixture.declarative import page
+
+
+# ==============================================================================
+#                                     TESTING
+# ==============================================================================
+
+class IndexStatisticsTestCase(TestCase):
+
+    def setUp(self):
+        self.statistics = IndexStatistics()
+
+
+    def test_rank(self):
+        # Without statistics, keys are sorted by name
+        self.assertEquals(['accessible', 'url'], self.statistics.rank('Page', ['url', 'accessible']))
+
+        # Properties give a first guess
+        properties = {
+            'accessible': Property('accessible', Boolean(), index=True),
+            'url': Property('url', Url(), index=True, unique=True)
+        }
+        self.assertEquals('url', self.statistics.most_selective('Page', ['accessible', 'url'], properties))
+
+        # Configured statistics come first
+        self.statistics.set('Page', 'accessible', 0.9)
+        self.statistics.set('Page', 'title', 0.8)
+        self.assertEquals(['accessible', 'title', 'url'], self.statistics.rank('Page', ['url', 'title', 'accessible']))
+        self.assertIs(None, self.statistics.most_selective('Page', []))
+        self.assertRaises(Exception, self.statistics.set, 'Page', 'url', 2)
+
+
+    def test_sample(self):
+        client = Mock()
+        client.gremlin.return_value.content = {'results': [True, False, True, None, True]}
+        self.assertEquals(0.5, self.statistics.sample(client, page, 'accessible', size=5))
+        script, params = client.gremlin.call_args[0]
+        self.assertEquals(IndexStatistics.SAMPLE, script)
+        self.assertEquals({'model_key': 'element_type', 'model_name': 'Page', 'key': 'accessible', 'high': 4}, params)
+        self.assertEquals(0.5, self.statistics.get('Page', 'accessible'))
+
+        # Nothing to learn from an empty sample
+        client.gremlin.return_value.content = {'results': []}
+        self.assertIs(None, self.statistics.sample(client, page, 'title'))
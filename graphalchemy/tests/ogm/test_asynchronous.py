@@ -0,0 +1,149 @@
+#! /usr/bin/env python
+#-*- coding: utf-8 -*-
+
+# ==============================================================================
+#                                      IMPORTS
+# ==============================================================================
+
+from unittest import TestCase
+import threading
+
+from mock import Mock
+
+# Services
+from graphalchemy.ogm.asynchronous import AsyncSession
+from graphalchemy.ogm.query import Query
+
+# Fixtures
+from graphalchemy.fixture.declarative import Website
+from graphalchemy.fixture.declarative import website
+from graphalchemy.fixture.declarative import metadata
+
+
+# ==============================================================================
+#                                     TESTING
+# ==============================================================================
+
+def response(results):
+    response = Mock()
+    response.content = {'results': results}
+    return response
+
+
+def vertex(id, **properties):
+    properties.update({'_id': id, '_type': 'vertex', 'element_type': 'Website'})
+    return properties
+
+
+class AsyncSessionTestCase(TestCase):
+
+    def setUp(self):
+        self.clients = []
+        self.session = AsyncSession(Mock(), metadata, concurrency=2, client_factory=self.client_factory)
+
+
+    def tearDown(self):
+        self.session.close()
+
+
+    def client_factory(self):
+        client = Mock()
+        client.gremlin.return_value = response([11])
+        self.clients.append(client)
+        return client
+
+
+    def test_flush_async(self):
+        website = Website(name=u'AllRecipes')
+        self.session.add(website)
+        future = self.session.flush_async()
+        self.assertIs(self.session, future.get(1))
+
+        # The flush used the client of its own thread
+        self.assertEquals(11, website.id)
+        self.assertEquals(1, len(self.clients))
+        self.assertEquals(1, self.clients[0].gremlin.call_count)
+        self.assertEquals(0, self.session.client.gremlin.call_count)
+
+
+    def test_add_during_flush(self):
+        started = threading.Event()
+        release = threading.Event()
+        def gremlin(script, params):
+            started.set()
+            release.wait(1)
+            return response([11])
+        self.session.client_factory = lambda: Mock(gremlin=Mock(side_effect=gremlin))
+        self.session.add(Website(name=u'AllRecipes'))
+        future = self.session.flush_async()
+        self.assertTrue(started.wait(1))
+
+        # Changes wait for the running flush
+        added = threading.Event()
+        other = Website(name=u'FoodNetwork')
+        def add():
+            self.session.add(other)
+            added.set()
+        thread = threading.Thread(target=add)
+        thread.start()
+        self.assertFalse(added.wait(0.2))
+        release.set()
+        future.get(1)
+        self.assertTrue(added.wait(1))
+        thread.join()
+        self.assertEquals([other], self.session._new.values())
+
+
+    def test_concurrency(self):
+        started = []
+        both = threading.Event()
+        def query():
+            started.append(threading.current_thread())
+            if len(started) == 2:
+                both.set()
+            both.wait(1)
+            return both.is_set()
+
+        # Two queries run at the same time
+        queries = [Mock(_fetch=query, _load_all=lambda rows, track: rows) for i in range(2)]
+        futures = [self.session.all_async(q) for q in queries]
+        self.assertEquals([True, True], self.session.gather(futures, 1))
+        self.assertNotEquals(started[0], started[1])
+
+
+    def test_error(self):
+        query = Mock()
+        query._head.return_value._fetch.side_effect = Exception('Timeout')
+        future = self.session.first_async(query)
+        self.assertRaises(Exception, future.get, 1)
+        self.assertRaises(Exception, AsyncSession, Mock(), metadata, concurrency=0)
+
+
+    def test_concurrent_queries(self):
+        session = AsyncSession(Mock(), metadata, concurrency=2, identity_map_size=1,
+                               client_factory=self.client_factory)
+        fetching = []
+        both = threading.Event()
+        def gremlin(script, params):
+            fetching.append(threading.current_thread())
+            if len(fetching) == 2:
+                both.set()
+            both.wait(1)
+            return response([vertex(11, name=u'A'), vertex(12, name=u'B')])
+        session.client_factory = lambda: Mock(gremlin=Mock(side_effect=gremlin))
+
+        # The rows of both queries are fetched at the same time
+        all_future = session.all_async(Query(session, website, Website))
+        first_future = session.first_async(Query(session, website, Website))
+        all_future.wait(1)
+        first_future.wait(1)
+        self.assertNotEquals(fetching[0], fetching[1])
+
+        # They are only mapped on the calling thread
+        self.assertEquals(0, len(session.identity_map))
+        objs = all_future.get(1)
+        self.assertIs(objs[0], first_future.get(1))
+        self.assertIs(objs, all_future.get(1))
+        self.assertEquals(2, len(session.identity_map))
+        self.assertIs(objs[1], session.identity_map.get_by_id(12))
+        session.close()
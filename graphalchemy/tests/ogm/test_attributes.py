@@ -0,0 +1,90 @@
+#! /usr/bin/env python
+#-*- coding: utf-8 -*-
+
+# ==============================================================================
+#                                      IMPORTS
+# ==============================================================================
+
+from unittest import TestCase
+
+# Services
+from graphalchemy.ogm.attributes import InstrumentedAttribute
+from graphalchemy.ogm.attributes import instance_state
+from graphalchemy.ogm.identity import IdentityMap
+from graphalchemy.ogm.mapper import Mapper
+
+# Model
+from graphalchemy.blueprints.schema import Node
+from graphalchemy.blueprints.schema import MetaData
+from graphalchemy.blueprints.schema import Property
+from graphalchemy.blueprints.types import String
+
+
+# ==============================================================================
+#                                     TESTING
+# ==============================================================================
+
+class InstrumentedAttributeTestCase(TestCase):
+
+    def setUp(self):
+        class User(object):
+            lastname = u'Doe'
+            def __init__(self, firstname=None):
+                self.firstname = firstname
+        self.User = User
+        self.metadata = MetaData()
+        user = Node('User', self.metadata,
+            Property('firstname', String()),
+            Property('lastname', String()),
+        )
+        Mapper()(User, user)
+
+
+    def test_register(self):
+        self.assertIsInstance(self.User.firstname, InstrumentedAttribute)
+        self.assertIsInstance(self.User.lastname, InstrumentedAttribute)
+
+        # Objects behave as plain objects
+        user = self.User(u'John')
+        self.assertEquals(u'John', user.firstname)
+        self.assertEquals(u'Doe', user.lastname)
+        user.lastname = u'Smith'
+        self.assertEquals(u'Smith', user.lastname)
+        del user.lastname
+        self.assertEquals(u'Doe', user.lastname)
+        self.assertIs(None, instance_state(user))
+
+
+    def test_modified(self):
+        identity_map = IdentityMap()
+        user = self.User(u'John')
+        state = identity_map.add(user, 1)
+        self.assertIs(state, instance_state(user))
+        self.assertEquals(set(), state.modified)
+
+        # Assignments are recorded, and flag the object as dirty
+        user.firstname = u'Jane'
+        self.assertEquals(set(['firstname']), state.modified)
+        self.assertTrue(identity_map.is_dirty(user))
+
+        # Untracked objects are detached from their state
+        del identity_map[user]
+        self.assertIs(None, instance_state(user))
+        user.lastname = u'Smith'
+        self.assertEquals(set(['firstname']), state.modified)
+
+
+    def test_predicates(self):
+        predicate = self.User.lastname < u'M'
+        self.assertEquals(('lastname', 'lt', u'M'), (predicate.key, predicate.operator, predicate.value))
+        self.assertEquals('gte', (self.User.lastname >= u'M').operator)
+        self.assertEquals('eq', (self.User.lastname == u'Doe').operator)
+        self.assertEquals('neq', (self.User.lastname != u'Doe').operator)
+
+        predicate = self.User.firstname.between(u'A', u'C')
+        self.assertEquals(('between', (u'A', u'C')), (predicate.operator, predicate.value))
+        predicate = self.User.firstname.in_(iter([u'John', u'Jane']))
+        self.assertEquals(('in', [u'John', u'Jane']), (predicate.operator, predicate.value))
+
+        # Descriptors remain hashable
+        self.assertEquals(1, len(set([self.User.lastname, self.User.lastname])))
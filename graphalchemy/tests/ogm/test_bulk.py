@@ -0,0 +1,100 @@
+#! /usr/bin/env python
+#-*- coding: utf-8 -*-
+
+# ==============================================================================
+#                                      IMPORTS
+# ==============================================================================
+
+from unittest import TestCase
+
+from mock import Mock
+
+# Services
+from graphalchemy.ogm.bulk import BulkWriter
+
+
+# ==============================================================================
+#                                     TESTING
+# ==============================================================================
+
+def response(results):
+    response = Mock()
+    response.content = {'results': results}
+    return response
+
+
+class BulkWriterTestCase(TestCase):
+
+    def setUp(self):
+        self.client = Mock()
+        self.writer = BulkWriter(self.client, chunk_size=2)
+
+
+    def test_create_vertices(self):
+        self.client.gremlin.side_effect = [response([1, 2]), response([3])]
+
+        ids = self.writer.create_vertices([
+            {'name': 'A'},
+            {'name': 'B', 'domain': None},
+            {'name': 'C'},
+        ])
+
+        # One request per chunk, ids are returned in order
+        self.assertEquals([1, 2, 3], ids)
+        self.assertEquals(2, self.client.gremlin.call_count)
+        script, params = self.client.gremlin.call_args_list[0][0]
+        self.assertEquals(BulkWriter.CREATE_VERTICES, script)
+        self.assertEquals({'datas': [{'name': 'A'}, {'name': 'B'}]}, params)
+        script, params = self.client.gremlin.call_args_list[1][0]
+        self.assertEquals(BulkWriter.CREATE_VERTICES, script)
+        self.assertEquals({'datas': [{'name': 'C'}]}, params)
+
+        # Nothing to insert, nothing to send
+        self.client.gremlin.reset_mock()
+        self.assertEquals([], self.writer.create_vertices([]))
+        self.assertEquals(0, self.client.gremlin.call_count)
+
+
+    def test_create_vertices_mismatch(self):
+        self.client.gremlin.side_effect = [response([1])]
+        self.assertRaises(Exception, self.writer.create_vertices, [{'name': 'A'}, {'name': 'B'}])
+
+
+    def test_create_edges(self):
+        self.client.gremlin.side_effect = [response([7])]
+
+        ids = self.writer.create_edges([
+            {'outV': 1, 'inV': 2, 'label': 'hosts', 'data': {'since': 2013, 'accessible': None}},
+        ])
+
+        self.assertEquals([7], ids)
+        script, params = self.client.gremlin.call_args[0]
+        self.assertEquals(BulkWriter.CREATE_EDGES, script)
+        self.assertEquals({'edges': [
+            {'outV': 1, 'inV': 2, 'label': 'hosts', 'data': {'since': 2013}}
+        ]}, params)
+
+
+    def test_delete(self):
+        self.client.gremlin.side_effect = [response([2]), response([1])]
+
+        removed = self.writer.delete([1, 2, 3], [4])
+
+        # Edges come first, a chunk can mix edges and vertices
+        self.assertEquals(3, removed)
+        self.assertEquals(2, self.client.gremlin.call_count)
+        script, params = self.client.gremlin.call_args_list[0][0]
+        self.assertEquals(BulkWriter.DELETE, script)
+        self.assertEquals({'eids': [1, 2], 'vids': []}, params)
+        script, params = self.client.gremlin.call_args_list[1][0]
+        self.assertEquals({'eids': [3], 'vids': [4]}, params)
+
+        # Nothing to delete, nothing to send
+        self.client.gremlin.reset_mock()
+        self.assertEquals(0, self.writer.delete([], []))
+        self.assertEquals(0, self.client.gremlin.call_count)
+
+
+    def test_chunk_size(self):
+        self.assertEquals(BulkWriter.CHUNK_SIZE, BulkWriter(self.client).chunk_size)
+        self.assertRaises(Exception, BulkWriter, self.client, chunk_size=0)
@@ -0,0 +1,86 @@
+#! /usr/bin/env python
+#-*- coding: utf-8 -*-
+
+# ==============================================================================
+#                                      IMPORTS
+# ==============================================================================
+
+from unittest import TestCase
+
+# Services
+from graphalchemy.ogm.hydration import hydrator
+from graphalchemy.ogm.hydration import dehydrator
+from graphalchemy.ogm.mapper import Mapper
+
+# Model
+from graphalchemy.blueprints.schema import MetaData
+from graphalchemy.blueprints.schema import Node
+from graphalchemy.blueprints.schema import Property
+from graphalchemy.blueprints.types import Integer
+from graphalchemy.blueprints.types import String
+from graphalchemy.blueprints.types import Type
+
+
+# ==============================================================================
+#                                     TESTING
+# ==============================================================================
+
+class Upper(Type):
+
+    def to_py(self, value):
+        return value.upper()
+
+
+class HydrationTestCase(TestCase):
+
+    def setUp(self):
+        class User(object):
+            country = u'FR'
+            def __init__(self):
+                raise Exception('Hydration must not run __init__')
+        self.User = User
+        self.user = Node('User', MetaData(),
+            Property('name', String(), name_db='user_name'),
+            Property('age', Integer()),
+            Property('country', String()),
+            Property('code', Upper())
+        )
+        Mapper()(User, self.user)
+
+
+    def test_hydrate(self):
+        hydrate = hydrator(self.user, self.User)
+        obj, data = hydrate({'_id': 12, 'user_name': 'John', 'age': '42', 'code': 'ab', 'other': 1})
+
+        # Values are converted, objects are built without __init__
+        self.assertIsInstance(obj, self.User)
+        self.assertEquals((12, u'John', 42, u'AB'), (obj.id, obj.name, obj.age, obj.code))
+        self.assertIsInstance(obj.name, unicode)
+
+        # Missing properties fall back to the class default, or to None
+        self.assertEquals(u'FR', obj.country)
+        obj, data = hydrate({'_id': 13})
+        self.assertIs(None, obj.age)
+
+        # The values are kept as returned by the database
+        obj, data = hydrate({'_id': 12, 'user_name': 'John', 'age': '42'})
+        self.assertEquals({'user_name': 'John', 'age': '42'}, data)
+
+        # The function is generated once per class
+        self.assertIs(hydrate, hydrator(self.user, self.User))
+
+
+    def test_dehydrate(self):
+        obj, data = hydrator(self.user, self.User)({'_id': 12, 'user_name': u'John', 'age': 42})
+        self.assertEquals({
+            'user_name': u'John',
+            'age': 42,
+            'country': u'FR',
+            'code': None,
+            'element_type': 'User'
+        }, dehydrator(self.user, self.User)(obj))
+
+        # New properties regenerate the functions
+        self.user.add_property(Property('email', String()))
+        obj.email = u'john@doe.com'
+        self.assertEquals(u'john@doe.com', dehydrator(self.user, self.User)(obj)['email'])
@@ -0,0 +1,161 @@
+#! /usr/bin/env python
+#-*- coding: utf-8 -*-
+
+# ==============================================================================
+#                                      IMPORTS
+# ==============================================================================
+
+from unittest import TestCase
+import gc
+
+# Services
+from graphalchemy.ogm.identity import IdentityMap
+from graphalchemy.ogm.state import InstanceState
+
+# Fixtures
+from graphalchemy.fixture.declarative import Page
+
+
+# ==============================================================================
+#                                     TESTING
+# ==============================================================================
+
+class IdentityMapTestCase(TestCase):
+
+    def setUp(self):
+        self.identity_map = IdentityMap()
+
+
+    def test_add(self):
+        page = Page()
+
+        # Without id, the object is tracked but not indexed
+        state = self.identity_map.add(page)
+        self.assertIsInstance(state, InstanceState)
+        self.assertIn(page, self.identity_map)
+        self.assertIs(None, self.identity_map.get_by_id(1))
+
+        # Adding again keeps the same state, and indexes the id
+        self.assertIs(state, self.identity_map.add(page, 1))
+        self.assertEquals(1, state.id)
+        self.assertIs(page, self.identity_map.get_by_id(1))
+
+
+    def test_add_all(self):
+        identity_map = IdentityMap(max_size=2)
+        states = identity_map.add_all([(Page(), 10 + i, {'title': i}) for i in range(3)])
+
+        # States are bound to their ids and values
+        self.assertEquals([10, 11, 12], [state.id for state in states])
+        self.assertFalse(states[1].attribute_has_changed('title', 1))
+
+        # The least recently added objects are evicted once
+        gc.collect()
+        self.assertEquals(2, len(identity_map))
+        self.assertIs(None, identity_map.get_by_id(10))
+        self.assertIsNot(None, identity_map.get_by_id(12))
+
+
+    def test_get_by_id(self):
+        pages = [Page() for i in range(10)]
+        for i, page in enumerate(pages):
+            self.identity_map.add(page, i)
+        self.assertIs(pages[7], self.identity_map.get_by_id(7))
+        self.assertIs(None, self.identity_map.get_by_id(10))
+
+        # The index is maintained through direct assignment
+        page = Page()
+        state = InstanceState(page)
+        state.update_id(10)
+        self.identity_map[page] = state
+        self.assertIs(page, self.identity_map.get_by_id(10))
+
+        # Removal
+        del self.identity_map[pages[7]]
+        self.assertIs(None, self.identity_map.get_by_id(7))
+        self.identity_map.pop(pages[8])
+        self.assertIs(None, self.identity_map.get_by_id(8))
+        self.identity_map.clear()
+        self.assertIs(None, self.identity_map.get_by_id(1))
+        self.assertEquals(0, len(self.identity_map))
+
+
+    def test_weak(self):
+        identity_map = IdentityMap(weak=True)
+        page = Page()
+        identity_map.add(page, 1)
+        self.assertIs(page, identity_map.get_by_id(1))
+
+        # Released objects are dropped
+        del page
+        gc.collect()
+        self.assertEquals(0, len(identity_map))
+        self.assertIs(None, identity_map.get_by_id(1))
+
+        # Dirty objects are kept alive until they are clean
+        page = Page()
+        identity_map.add(page, 2)
+        identity_map.mark_dirty(page)
+        self.assertTrue(identity_map.is_dirty(page))
+        del page
+        gc.collect()
+        page = identity_map.get_by_id(2)
+        self.assertIsInstance(page, Page)
+        self.assertEquals([page], identity_map.dirty)
+        identity_map.mark_clean(page)
+        self.assertFalse(identity_map.is_dirty(page))
+        del page
+        gc.collect()
+        self.assertIs(None, identity_map.get_by_id(2))
+
+
+    def test_max_size(self):
+        identity_map = IdentityMap(max_size=2)
+        identity_map.add(Page(), 0)
+        identity_map.add(Page(), 1)
+
+        # Accessing an object makes it the most recently used
+        identity_map.get_by_id(0)
+        identity_map.add(Page(), 2)
+        gc.collect()
+        self.assertEquals(2, len(identity_map))
+        self.assertIs(None, identity_map.get_by_id(1))
+        self.assertIsNot(None, identity_map.get_by_id(0))
+
+        # Objects still referenced by user code are never evicted
+        held = Page()
+        identity_map.add(held, 3)
+        identity_map.add(Page(), 4)
+        identity_map.add(Page(), 5)
+        gc.collect()
+        self.assertIn(held, identity_map)
+        self.assertEquals(3, len(identity_map))
+        self.assertIs(held, identity_map.get_by_id(3))
+
+        # Dirty objects are never evicted
+        del held
+        for id in (10, 11):
+            identity_map.add(Page(), id)
+            identity_map.mark_dirty(identity_map.get_by_id(id))
+        identity_map.add(Page(), 12)
+        identity_map.add(Page(), 13)
+        gc.collect()
+        self.assertEquals(4, len(identity_map))
+
+        # The excess is evicted once they are clean
+        identity_map.mark_clean(identity_map.get_by_id(10))
+        gc.collect()
+        self.assertEquals(3, len(identity_map))
+        self.assertIs(None, identity_map.get_by_id(12))
+
+        # Nothing is evicted while eviction is held
+        with identity_map.hold_eviction():
+            for id in range(20, 23):
+                identity_map.add(Page(), id)
+            gc.collect()
+            self.assertEquals(6, len(identity_map))
+        gc.collect()
+        self.assertEquals(3, len(identity_map))
+        self.assertIs(None, identity_map.get_by_id(20))
+
+        self.assertRaises(Exception, IdentityMap, max_size=0)
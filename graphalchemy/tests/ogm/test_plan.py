@@ -0,0 +1,74 @@
+#! /usr/bin/env python
+#-*- coding: utf-8 -*-
+
+# ==============================================================================
+#                                      IMPORTS
+# ==============================================================================
+
+from unittest import TestCase
+
+# Services
+from graphalchemy.ogm.plan import FlushPlan
+from graphalchemy.ogm.identity import IdentityMap
+
+# Fixtures
+from graphalchemy.fixture.declarative import Page
+from graphalchemy.fixture.declarative import Website
+from graphalchemy.fixture.declarative import WebsiteHostsPage
+from graphalchemy.fixture.declarative import metadata
+
+
+# ==============================================================================
+#                                     TESTING
+# ==============================================================================
+
+class FlushPlanTestCase(TestCase):
+
+    def setUp(self):
+        self.identity_map = IdentityMap()
+        self.plan = FlushPlan(metadata, self.identity_map, chunk_size=2)
+
+
+    def test_operations(self):
+        website = Website(name=u'AllRecipes')
+        page = Page(title=u'Page 1')
+        hosts = WebsiteHostsPage(since=2013, outV=website, inV=page)
+        old_hosts = WebsiteHostsPage(since=2012, outV=1, inV=2)
+        old_page = Page(title=u'Page 2')
+        self.identity_map.add(old_hosts, 21)
+        self.identity_map.add(old_page, 11)
+
+        for obj, state in [(old_page, 'delete'), (hosts, 'new'), (page, 'new'),
+                           (old_hosts, 'delete'), (website, 'new')]:
+            self.plan.add(obj, state)
+
+        # Nodes before the relationships they bind, the reverse for deletes
+        self.assertEquals([
+            (page, 'new'), (website, 'new'), (hosts, 'new'),
+            (old_hosts, 'delete'), (old_page, 'delete')
+        ], self.plan.operations())
+        self.assertEquals(['Page', 'Website'], self.plan.groups('insert_nodes').keys())
+        self.assertEquals(5, len(self.plan))
+        self.assertRaises(Exception, self.plan.add, page, 'merge')
+
+
+    def test_count_requests(self):
+        pages = [Page(title=u'Page '+str(i)) for i in range(3)]
+        for page in pages:
+            self.plan.add(page, 'new')
+        website = Website(name=u'AllRecipes')
+        self.identity_map.add(website, 11).update_attributes({'name': u'AllRecipes'})
+        self.plan.add(website, 'update')
+        self.plan.add(Page(title=u'Unpersisted'), 'delete')
+
+        # Two insert chunks, an unchanged object and nothing to delete
+        self.assertEquals(2, self.plan.count_requests())
+
+        # One more request per changed object
+        website.name = u'FoodNetwork'
+        self.identity_map[website].modify('name')
+        self.assertEquals(3, self.plan.count_requests())
+
+        # Each unit of work sends its own chunks
+        self.plan.batch_size = 1
+        self.assertEquals(4, self.plan.count_requests())
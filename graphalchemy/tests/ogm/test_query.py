@@ -0,0 +1,437 @@
+#! /usr/bin/env python
+#-*- coding: utf-8 -*-
+
+# ==============================================================================
+#                                      IMPORTS
+# ==============================================================================
+
+from unittest import TestCase
+
+from mock import Mock
+
+# Services
+from graphalchemy.ogm.session import Session
+from graphalchemy.ogm.query import Query
+from graphalchemy.ogm.query import NoResultFound
+from graphalchemy.ogm.query import MultipleResultsFound
+from graphalchemy.ogm.mapper import Mapper
+from graphalchemy.ogm.options import eager
+
+# Model
+from graphalchemy.blueprints.predicates import Predicate
+from graphalchemy.blueprints.schema import MetaData
+from graphalchemy.blueprints.schema import Node
+from graphalchemy.blueprints.schema import Property
+from graphalchemy.blueprints.types import Boolean
+from graphalchemy.blueprints.types import Integer
+from graphalchemy.blueprints.types import String
+from graphalchemy.blueprints.types import Url
+
+# Fixtures
+from graphalchemy.fixture.declarative import Page
+from graphalchemy.fixture.declarative import Website
+from graphalchemy.fixture.declarative import WebsiteHostsPage
+from graphalchemy.fixture.declarative import page
+from graphalchemy.fixture.declarative import website
+from graphalchemy.fixture.declarative import websiteHostsPageZ
+from graphalchemy.fixture.declarative import metadata
+
+
+# ==============================================================================
+#                                     LOCAL FIXTURES
+# ==============================================================================
+
+class Recipe(object):
+    pass
+
+recipe = Node('Recipe', MetaData(),
+    Property('url', Url(), index=True),
+    Property('vegetarian', Boolean(), index=True),
+    Property('title', String(127), index=True),
+    Property('timeTotal', Integer())
+)
+Mapper()(Recipe, recipe)
+
+
+# ==============================================================================
+#                                     TESTING
+# ==============================================================================
+
+def response(results):
+    response = Mock()
+    response.content = {'results': results}
+    return response
+
+
+def vertex(id, **properties):
+    properties.update({'_id': id, '_type': 'vertex'})
+    return properties
+
+
+class QueryTestCase(TestCase):
+
+    def setUp(self):
+        self.client = Mock()
+        self.session = Session(client=self.client, metadata=metadata)
+
+
+    def query(self, model=page, class_=Page):
+        return Query(self.session, model, class_)
+
+
+    def test_compile(self):
+        # The model name index is used by default
+        self.assertEquals((
+            u'g.V("element_type", model_name).has("title", p0).has("url", p1)',
+            {'model_name': 'Page', 'p0': u'Foo', 'p1': u'http://foo.com'}
+        ), self.query().filter(url=u'http://foo.com', title=u'Foo').compile())
+
+        # Then indexed properties
+        self.assertEquals((
+            u'g.V("name", index_value).has("element_type", model_name).has("domain", p0)',
+            {'model_name': 'Website', 'index_value': u'Foo', 'p0': u'foo.com'}
+        ), self.query(website, Website).filter(name=u'Foo', domain=u'foo.com').compile())
+
+        # Then the id
+        self.assertEquals((
+            u'[g.v(id)].findAll{ it != null }._().has("element_type", model_name)',
+            {'model_name': 'Page', 'id': 12}
+        ), self.query().filter(id=12).compile())
+        self.assertEquals((
+            u'g.E.has("label", model_name)',
+            {'model_name': 'hosts'}
+        ), self.query(websiteHostsPageZ, WebsiteHostsPage).compile())
+
+
+    def test_pagination(self):
+        script, params = self.query().offset(20).limit(10).compile()
+        self.assertEquals(u'g.V("element_type", model_name).range(low, high)', script)
+        self.assertEquals((20, 29), (params['low'], params['high']))
+
+        script, params = self.query().offset(20).compile()
+        self.assertEquals((20, -1), (params['low'], params['high']))
+
+        script, params = self.query().slice(5, 8).slice(1, 2).compile()
+        self.assertEquals((6, 6), (params['low'], params['high']))
+
+        # Nothing to fetch
+        self.assertEquals([], self.query().limit(0).all())
+        self.assertEquals(0, self.client.gremlin.call_count)
+
+
+    def test_first(self):
+        self.client.gremlin.return_value = response([vertex(12, title=u'Page 1', element_type=u'Page')])
+        query = self.query().filter(title=u'Page 1').offset(3)
+        obj = query.first()
+
+        # A single row is requested
+        script, params = self.client.gremlin.call_args[0]
+        self.assertEquals((3, 3), (params['low'], params['high']))
+        self.assertIsInstance(obj, Page)
+        self.assertEquals(u'Page 1', obj.title)
+        self.assertEquals(12, obj.id)
+
+        # The object is tracked, and returned as is by later queries
+        self.assertIs(obj, self.session.identity_map.get_by_id(12))
+        self.assertFalse(self.session.identity_map.is_dirty(obj))
+        self.assertIs(obj, query.first())
+
+        self.client.gremlin.return_value = response([])
+        self.assertIs(None, query.first())
+
+
+    def test_one(self):
+        self.client.gremlin.return_value = response([vertex(12), vertex(13)])
+        self.assertRaises(MultipleResultsFound, self.query().one)
+        script, params = self.client.gremlin.call_args[0]
+        self.assertEquals((0, 1), (params['low'], params['high']))
+
+        self.client.gremlin.return_value = response([])
+        self.assertRaises(NoResultFound, self.query().one)
+
+        self.client.gremlin.return_value = response([vertex(12)])
+        self.assertEquals(12, self.query().one().id)
+
+
+    def test_yield_per(self):
+        pages = [vertex(id, title=u'Page '+str(id)) for id in range(10, 15)]
+        self.client.gremlin.side_effect = [response(pages[0:2]), response(pages[2:4]), response(pages[4:5])]
+        iterator = iter(self.query().yield_per(2, track=False))
+
+        # Pages are requested lazily
+        self.assertEquals(0, self.client.gremlin.call_count)
+        self.assertEquals(u'Page 10', next(iterator).title)
+        self.assertEquals(1, self.client.gremlin.call_count)
+        objs = list(iterator)
+        self.assertEquals([11, 12, 13, 14], [obj.id for obj in objs])
+        self.assertEquals([(0, 1), (2, 3), (4, 5)], [
+            (params['low'], params['high']) for (script, params), kwargs in self.client.gremlin.call_args_list
+        ])
+
+        # Nothing was registered
+        self.assertEquals(0, len(self.session.identity_map))
+
+
+    def test_yield_per_limit(self):
+        self.client.gremlin.side_effect = [response([vertex(10), vertex(11)]), response([vertex(12)])]
+        objs = self.query().offset(5).limit(3).yield_per(2).all()
+        self.assertEquals([10, 11, 12], [obj.id for obj in objs])
+        self.assertEquals([(5, 6), (7, 7)], [
+            (params['low'], params['high']) for (script, params), kwargs in self.client.gremlin.call_args_list
+        ])
+        self.assertEquals(3, len(self.session.identity_map))
+        self.assertRaises(Exception, self.query().yield_per, 0)
+
+
+    def test_page(self):
+        query = self.query(website, Website).filter(domain=u'foo.com').order_by('name')
+        self.client.gremlin.return_value = response([
+            vertex(10, name=u'A'), vertex(11, name=u'B'), vertex(12, name=u'B')
+        ])
+        objs, cursor = query.page(2)
+        self.assertEquals([10, 11], [obj.id for obj in objs])
+        script, params = self.client.gremlin.call_args[0]
+        self.assertEquals(u'g.V("element_type", model_name).has("domain", p0)'
+            u'.inject(new TreeSet({ a, b -> a.getProperty("name") <=> b.getProperty("name") ?: a.id <=> b.id } as Comparator))'
+            u'{ top, element -> top.add(element); if (high >= 0 && top.size() > high + 1) top.pollLast(); top }._()'
+            u'.range(low, high)', script)
+        self.assertEquals((0, 2), (params['low'], params['high']))
+
+        # Without pagination, all the elements are sorted
+        script, params = self.query(website, Website).order_by('name').compile()
+        self.assertEquals(u'g.V("element_type", model_name)'
+            u'.order{ it.a.getProperty("name") <=> it.b.getProperty("name") ?: it.a.id <=> it.b.id }', script)
+
+        # The next page resumes after the last key
+        self.client.gremlin.return_value = response([vertex(12, name=u'B')])
+        objs, next_cursor = query.page(2, cursor)
+        self.assertEquals([12], [obj.id for obj in objs])
+        self.assertIs(None, next_cursor)
+        script, params = self.client.gremlin.call_args[0]
+        self.assertEquals(u'g.V.has("name", T.gte, after_value).has("element_type", model_name).has("domain", p0)'
+            u'.or(_().has("name", T.gt, after_value), _().has("id", T.gt, after_id))'
+            u'.inject(new TreeSet({ a, b -> a.getProperty("name") <=> b.getProperty("name") ?: a.id <=> b.id } as Comparator))'
+            u'{ top, element -> top.add(element); if (high >= 0 && top.size() > high + 1) top.pollLast(); top }._()'
+            u'.range(low, high)', script)
+        self.assertEquals((u'B', 11), (params['after_value'], params['after_id']))
+
+        # Only indexed properties can be used
+        self.assertRaises(Exception, self.query(website, Website).order_by, 'domain')
+        self.assertRaises(Exception, self.query().page, 2)
+        self.assertRaises(Exception, query.page, 2, 'foo')
+
+
+    def test_page_id(self):
+        self.client.gremlin.return_value = response([vertex(10), vertex(11)])
+        query = self.query().order_by()
+        objs, cursor = query.page(1)
+        query.page(1, cursor)
+        script, params = self.client.gremlin.call_args[0]
+        self.assertEquals(u'g.V("element_type", model_name).has("id", T.gt, after_id)'
+            u'.inject(new TreeSet({ a, b -> a.id <=> b.id } as Comparator))'
+            u'{ top, element -> top.add(element); if (high >= 0 && top.size() > high + 1) top.pollLast(); top }._()'
+            u'.range(low, high)', script)
+        self.assertEquals(10, params['after_id'])
+
+
+    def test_count(self):
+        self.client.gremlin.return_value = response([42])
+        self.assertEquals(42, self.query().filter(title=u'Foo').count())
+        self.client.gremlin.assert_called_once_with(
+            u'g.V("element_type", model_name).has("title", p0).count()',
+            {'model_name': 'Page', 'p0': u'Foo'}
+        )
+        self.assertEquals(0, self.query().limit(0).count())
+
+
+    def test_exists(self):
+        self.client.gremlin.return_value = response([True])
+        self.assertTrue(self.query().filter(title=u'Foo').exists())
+        script, params = self.client.gremlin.call_args[0]
+        self.assertEquals(u'g.V("element_type", model_name).has("title", p0).hasNext()', script)
+
+        self.client.gremlin.return_value = response([False])
+        self.assertFalse(self.query().exists())
+        self.assertEquals(0, len(self.session.identity_map))
+
+
+    def test_invalid_keys(self):
+        evil = 'evil", 1).sideEffect{g.clear()}.has("x'
+
+        # Unknown properties are rejected, nothing is compiled
+        Query._scripts.clear()
+        self.assertRaises(Exception, self.query().filter(**{evil: 1}).compile)
+        self.assertRaises(Exception, self.query().filter(foo=1).compile)
+        self.assertEquals(0, len(Query._scripts))
+
+        # Without a model, keys must be plain names
+        query = Query(self.session)
+        self.assertRaises(Exception, query.filter(**{evil: 1}).compile)
+        self.assertRaises(Exception, Query(self.session).indexed_filter('page', evil, 1).compile)
+        self.assertRaises(Exception, Query(self.session).filter(Predicate(evil, 'lt', 1)).compile)
+        self.assertRaises(Exception, Query(self.session).filter(Predicate(evil, 'in', [1])).compile)
+        self.assertRaises(Exception, Predicate.lookup, evil, u'index_values')
+        script, params = Query(self.session).filter(title=u'Foo').compile()
+        self.assertEquals(u'g.V.has("title", p0)', script)
+
+
+    def test_compile_cache(self):
+        Query._scripts.clear()
+        script1, params1 = self.query().filter(title=u'Foo').limit(10).compile()
+        script2, params2 = self.query().filter(title=u'Bar').limit(20).compile()
+
+        # Queries of the same shape share the same script
+        self.assertIs(script1, script2)
+        self.assertEquals(1, len(Query._scripts))
+        self.assertEquals((u'Bar', 19), (params2['p0'], params2['high']))
+
+        # Any change of shape compiles a new script
+        self.query().filter(url=u'Foo').limit(10).compile()
+        self.query().filter(title=u'Foo').compile()
+        self.assertEquals(3, len(Query._scripts))
+
+
+    def test_index_choice(self):
+        query = self.query(recipe, Recipe).filter(vegetarian=True, url=u'http://foo.com', title=u'Lasagna')
+
+        # Booleans are the least selective, ties are broken by name
+        script, params = query.compile()
+        self.assertEquals(u'g.V("title", index_value).has("element_type", model_name)'
+            u'.has("url", p0).has("vegetarian", p1)', script)
+
+        # Statistics take over
+        self.session.statistics.set('Recipe', 'url', 1.0)
+        script, params = query.compile()
+        self.assertEquals(u'g.V("url", index_value).has("element_type", model_name)'
+            u'.has("title", p0).has("vegetarian", p1)', script)
+        self.assertEquals(u'http://foo.com', params['index_value'])
+
+
+    def test_intersect(self):
+        self.client.gremlin.side_effect = [
+            response([[13, 11, 12], [12, 14, 13], [10, 12, 13]]),
+            response([vertex(13), vertex(12)])
+        ]
+        query = self.query(recipe, Recipe).filter(
+            vegetarian=True, url=u'http://foo.com', title=u'Lasagna'
+        ).intersect()
+        objs = query.limit(5).all()
+
+        # All indices are looked up at once, ids only
+        script, params = self.client.gremlin.call_args_list[0][0]
+        self.assertEquals(Query.LOOKUP_IDS, script)
+        self.assertEquals([u'title', u'url', u'vegetarian'], [lookup['key'] for lookup in params['lookups']])
+
+        # Only the intersection is fetched
+        script, params = self.client.gremlin.call_args_list[1][0]
+        self.assertEquals(u'ids.collect{ g.v(it) }.findAll{ it != null }._()'
+            u'.has("element_type", model_name).range(low, high)', script)
+        self.assertEquals([13, 12], params['ids'])
+        self.assertEquals([13, 12], [obj.id for obj in objs])
+
+        # Nothing is fetched when the intersection is empty
+        self.client.gremlin.side_effect = [response([[13], [12], [12]])]
+        self.assertEquals(0, query.count())
+        self.assertEquals(3, self.client.gremlin.call_count)
+
+
+    def test_predicates(self):
+        query = self.query(recipe, Recipe).filter(
+            Recipe.timeTotal < 30, Recipe.title.between(u'A', u'C'), Recipe.vegetarian == True
+        )
+
+        # Equalities use the indices, comparisons are bound by position
+        script, params = query.compile()
+        self.assertEquals(u'g.V("vegetarian", index_value).has("element_type", model_name)'
+            u'.has("timeTotal", T.lt, q0).interval("title", q1[0], q1[1])', script)
+        self.assertEquals((True, 30, [u'A', u'C']), (params['index_value'], params['q0'], params['q1']))
+
+        # In predicates on indexed properties are looked up value by value
+        script, params = self.query(recipe, Recipe).filter(
+            Recipe.timeTotal.in_([10, 20]), Recipe.url.in_([u'http://foo.com'])
+        ).compile()
+        self.assertEquals(u'index_values.collect{ g.V("url", it).toList() }.flatten()._()'
+            u'.has("element_type", model_name).has("timeTotal", T.in, q0)', script)
+        self.assertEquals(([u'http://foo.com'], [10, 20]), (params['index_values'], params['q0']))
+
+        # Values are cast to their database type
+        self.client.gremlin.return_value = response([vertex(1, timeTotal=10)])
+        objs = self.query(recipe, Recipe).filter(Recipe.timeTotal >= 5).all()
+        script, params = self.client.gremlin.call_args[0]
+        self.assertEquals(u'g.V("element_type", model_name).has("timeTotal", T.gte, q0)', script)
+        self.assertEquals(10, objs[0].timeTotal)
+
+        # Comparisons on indexed properties start from the index
+        script, params = self.query(recipe, Recipe).filter(Recipe.title < u'C').compile()
+        self.assertEquals(u'g.V.has("title", T.lt, q0).has("element_type", model_name)', script)
+        self.assertEquals(u'C', params['q0'])
+        script, params = self.query(recipe, Recipe).filter(
+            Recipe.timeTotal < 30, Recipe.url > u'http://a', Recipe.title.between(u'A', u'C')
+        ).compile()
+        self.assertEquals(u'g.V.interval("title", q0[0], q0[1]).has("element_type", model_name)'
+            u'.has("timeTotal", T.lt, q1).has("url", T.gt, q2)', script)
+        self.assertEquals(([u'A', u'C'], 30, u'http://a'), (params['q0'], params['q1'], params['q2']))
+
+
+    def test_eager(self):
+        self.client.gremlin.return_value = response([
+            [vertex(1, title=u'Page 1'), [[
+                {'_id': 101, '_type': 'edge', '_label': 'hosts', '_outV': 5, '_inV': 1, 'accessible': 1},
+                vertex(5, element_type='Website', name=u'Foo')
+            ]]],
+            [vertex(2, title=u'Page 2'), []]
+        ])
+        pages = self.query().options(eager('isHostedBy')).limit(2).all()
+
+        # The edges and nodes come along with the pages, in one traversal
+        self.assertEquals(1, self.client.gremlin.call_count)
+        script, params = self.client.gremlin.call_args[0]
+        self.assertEquals(u'g.V("element_type", model_name).range(low, high)'
+            u'.transform{ element -> [element, element.inE("hosts").collect{ edge -> '
+            u'[edge, edge.getVertex(Direction.OUT)] }] }', script)
+
+        # They fill the relation caches
+        self.assertEquals([1, 2], [page.id for page in pages])
+        relations = pages[0]._cache_in_hosts
+        relation, website = relations.items()[0]
+        self.assertIsInstance(relation, WebsiteHostsPage)
+        self.assertIsInstance(website, Website)
+        self.assertEquals(u'Foo', website.name)
+        self.assertIs(website, relation.outV)
+        self.assertIs(pages[0], relation.inV)
+        self.assertIs(website, self.session.identity_map.get_by_id(5))
+        self.assertEquals({}, pages[1]._cache_in_hosts)
+
+        # Counting does not load the adjacencies
+        self.client.gremlin.return_value = response([2])
+        self.query().options(eager('isHostedBy')).count()
+        script, params = self.client.gremlin.call_args[0]
+        self.assertEquals(u'g.V("element_type", model_name).count()', script)
+
+        # Only registered adjacencies can be loaded
+        self.assertRaises(Exception, self.query().options, eager('hosts'))
+
+
+    def test_hydrate_all(self):
+        tracked = Page()
+        self.session.identity_map.add(tracked, 2)
+        self.client.gremlin.return_value = response([
+            vertex(1, element_type='Page', title=u'Page 1'),
+            vertex(2, element_type='Page', title=u'Page 2'),
+            vertex(3, element_type='Website', name=u'Foo'),
+            {'_id': 4, '_type': 'edge', '_label': 'hosts', '_outV': 3, '_inV': 1},
+            vertex(5, element_type='Unknown'),
+            vertex(1, element_type='Page', title=u'Page 1')
+        ])
+
+        # Untyped queries map each element from its model name
+        objs = self.query(None, None).all()
+        self.assertEquals([Page, Page, Website, WebsiteHostsPage, dict, Page], [obj.__class__ for obj in objs])
+        self.assertIs(tracked, objs[1])
+        self.assertIs(objs[0], objs[5])
+        self.assertEquals(u'Foo', objs[2].name)
+        self.assertEquals((3, 1), (objs[3].outV, objs[3].inV))
+
+        # All the new objects are tracked
+        self.assertEquals(4, len(self.session.identity_map))
+        self.assertIs(objs[2], self.session.identity_map.get_by_id(3))
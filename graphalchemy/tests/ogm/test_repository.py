@@ -7,8 +7,11 @@
 
 from unittest import TestCase
 
+from mock import Mock
+
 # Services
 from graphalchemy.ogm.repository import Repository
+from graphalchemy.ogm.session import Session
 from graphalchemy.fixture.declarative import Page
 from graphalchemy.fixture.declarative import page
 from graphalchemy.fixture.declarative import metadata
@@ -72,3 +75,43 @@ class RepositoryTestCase(TestCase):
 		# self.assertIs(obj, website_obj)
 
 
+
+
+class RepositoryGetManyTestCase(TestCase):
+
+	def setUp(self):
+		self.client = Mock()
+		self.session = Session(client=self.client, metadata=metadata)
+		self.repository = Repository(self.session, page, Page)
+
+
+	def test_get_many(self):
+		tracked = Page(title=u'Tracked')
+		self.session.identity_map.add(tracked, 12)
+		tracked.id = 12
+		response = Mock()
+		response.content = {'results': [
+			{'_id': 14, '_type': 'vertex', 'title': u'Page 14'},
+			{'_id': 11, '_type': 'vertex', 'title': u'Page 11'}
+		]}
+		self.client.gremlin.return_value = response
+
+		objs, missing = self.repository.get_many([14, 12, 13, 11, 14])
+
+		# Only the untracked ids are fetched, at once
+		self.assertEquals(1, self.client.gremlin.call_count)
+		script, params = self.client.gremlin.call_args[0]
+		self.assertEquals(u'ids.collect{ g.v(it) }.findAll{ it != null }._()'
+			u'.has("element_type", model_name)', script)
+		self.assertEquals([14, 13, 11], params['ids'])
+
+		# Results follow the given order
+		self.assertEquals([14, 12, 11, 14], [obj.id for obj in objs])
+		self.assertIs(tracked, objs[1])
+		self.assertIs(objs[0], objs[3])
+		self.assertEquals([13], missing)
+
+		# Tracked ids are served from memory
+		objs, missing = self.repository.get_many([11, 12])
+		self.assertEquals(1, self.client.gremlin.call_count)
+		self.assertEquals([11, 12], [obj.id for obj in objs])
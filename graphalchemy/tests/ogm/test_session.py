@@ -0,0 +1,468 @@
+#! /usr/bin/env python
+#-*- coding: utf-8 -*-
+
+# ==============================================================================
+#                                      IMPORTS
+# ==============================================================================
+
+from unittest import TestCase
+import json
+import gc
+
+from mock import Mock
+
+# Services
+from graphalchemy.ogm.session import Session
+from graphalchemy.ogm.bulk import BulkWriter
+from graphalchemy.ogm.query import Query
+from graphalchemy.ogm.mapper import Mapper
+
+# Model
+from graphalchemy.blueprints.schema import MetaData
+from graphalchemy.blueprints.schema import Node
+from graphalchemy.blueprints.schema import Property
+from graphalchemy.blueprints.types import List
+from graphalchemy.blueprints.types import String
+
+# Fixtures
+from graphalchemy.fixture.declarative import Page
+from graphalchemy.fixture.declarative import Website
+from graphalchemy.fixture.declarative import WebsiteHostsPage
+from graphalchemy.fixture.declarative import metadata
+
+
+# ==============================================================================
+#                                     LOCAL FIXTURES
+# ==============================================================================
+
+class Recipe(object):
+    pass
+
+recipe = Node('Recipe', MetaData(),
+    Property('title', String()),
+    Property('tags', List())
+)
+Mapper()(Recipe, recipe)
+
+
+# ==============================================================================
+#                                     TESTING
+# ==============================================================================
+
+def response(results):
+    response = Mock()
+    response.content = {'results': results}
+    return response
+
+
+class SessionTestCase(TestCase):
+
+    def setUp(self):
+        self.client = Mock()
+        self.session = Session(client=self.client, metadata=metadata, chunk_size=2)
+
+
+    def test_flush_new(self):
+        self.client.gremlin.side_effect = [response([11, 12]), response([13])]
+
+        website = Website(name=u'AllRecipes', domain=u'http://www.allrecipes.com')
+        page1 = Page(title=u'Page 1', url=u'http://www.allrecipes.com/page/1')
+        page2 = Page(title=u'Page 2', url=u'http://www.allrecipes.com/page/2')
+        self.session.add(website)
+        self.session.add(page1)
+        self.session.add(page2)
+        self.session.add(website)
+        self.session.flush()
+
+        # One request per chunk, no per-vertex request
+        self.assertEquals(2, self.client.gremlin.call_count)
+        self.assertEquals(0, self.client.create_vertex.call_count)
+        script, params = self.client.gremlin.call_args_list[0][0]
+        self.assertEquals(BulkWriter.CREATE_VERTICES, script)
+        self.assertEquals(u'Website', params['datas'][0]['element_type'])
+        self.assertEquals(u'AllRecipes', params['datas'][0]['name'])
+
+        # Ids are assigned in order and the identity map is filled
+        self.assertEquals(11, website.id)
+        self.assertEquals(12, page1.id)
+        self.assertEquals(13, page2.id)
+        self.assertIn(website, self.session.identity_map)
+        self.assertEquals(12, self.session.identity_map[page1].id)
+
+        # Objects are then retrieved by id without hitting the database
+        self.assertEquals((page1, False), self.session.get_vertex(12))
+        self.assertEquals(0, self.client.get_vertex.call_count)
+
+
+    def test_flush_update(self):
+        self.client.gremlin.side_effect = [response([11])]
+        website = Website(name=u'AllRecipes')
+        self.session.add(website)
+        self.session.flush()
+
+        # Known objects are updated, and protected until then
+        website.name = u'FoodNetwork'
+        self.session.add(website)
+        self.assertTrue(self.session.identity_map.is_dirty(website))
+        self.session.flush()
+        self.client.update_vertex.assert_called_once_with(11, {'name': u'FoodNetwork'})
+        self.assertFalse(self.session.identity_map.is_dirty(website))
+        self.assertEquals(1, self.client.gremlin.call_count)
+
+
+    def test_flush_dirty(self):
+        self.client.gremlin.side_effect = [response([11, 12])]
+        website = Website(name=u'AllRecipes')
+        page = Page(title=u'Page 1')
+        self.session.add(website)
+        self.session.add(page)
+        self.session.flush()
+        self.assertEquals([], self.session.identity_map.dirty)
+
+        # Assignments are tracked without adding the objects again
+        page.title = u'Page 2'
+        website.name = u'AllRecipes'
+        self.assertEquals(set([page, website]), set(self.session.identity_map.dirty))
+        self.session.flush()
+
+        # Only the changed property of the changed object is sent
+        self.client.update_vertex.assert_called_once_with(12, {'title': u'Page 2'})
+        self.assertEquals([], self.session.identity_map.dirty)
+
+        # Nothing left to flush
+        self.client.update_vertex.reset_mock()
+        self.session.flush()
+        self.assertEquals(0, self.client.update_vertex.call_count)
+
+
+    def test_flush_delete(self):
+        self.client.gremlin.side_effect = [response([11, 12]), response([21]), response([2])]
+        website = Website(name=u'AllRecipes')
+        page = Page(title=u'Page 1')
+        hosts = WebsiteHostsPage(since=2013, outV=website, inV=page)
+        for obj in [website, page, hosts]:
+            self.session.add(obj)
+        self.session.flush()
+
+        # Unflushed objects are simply forgotten
+        other = Page(title=u'Page 2')
+        self.session.add(other)
+        self.session.delete(other)
+
+        self.session.delete(website)
+        self.session.delete(hosts)
+        self.session.flush()
+
+        # Relationships and nodes are removed by a single request
+        self.assertEquals(3, self.client.gremlin.call_count)
+        script, params = self.client.gremlin.call_args[0]
+        self.assertEquals(BulkWriter.DELETE, script)
+        self.assertEquals({'eids': [21], 'vids': [11]}, params)
+        self.assertEquals(2, self.session.last_deleted_count)
+        self.assertNotIn(website, self.session.identity_map)
+        self.assertNotIn(hosts, self.session.identity_map)
+        self.assertIn(page, self.session.identity_map)
+
+
+    def test_flush_batch_size(self):
+        self.client.gremlin.side_effect = [
+            response([11, 12]), response([13]), response([21]), response([1])
+        ]
+        website = Website(name=u'AllRecipes')
+        page1 = Page(title=u'Page 1')
+        page2 = Page(title=u'Page 2')
+        hosts = WebsiteHostsPage(since=2013, outV=website, inV=page2)
+        for obj in [hosts, website, page1, page2]:
+            self.session.add(obj)
+        self.assertEquals(3, self.session.plan(batch_size=2).count_requests())
+        self.session.flush(batch_size=2)
+
+        # One unit of work per chunk, nodes first
+        self.assertEquals(3, self.client.gremlin.call_count)
+        self.assertEquals([BulkWriter.CREATE_VERTICES, BulkWriter.CREATE_VERTICES, BulkWriter.CREATE_EDGES],
+            [args[0][0] for args in self.client.gremlin.call_args_list])
+        self.assertEquals([{'outV': 11, 'inV': 13, 'label': 'hosts', 'data': {'since': 2013}}],
+            self.client.gremlin.call_args[0][1]['edges'])
+        self.assertEquals(0, len(self.session._new))
+
+        # A failing chunk leaves the next ones pending
+        page1.title = u'Page 3'
+        page2.title = u'Page 4'
+        self.client.update_vertex.side_effect = [None, Exception('Timeout')]
+        self.assertRaises(Exception, self.session.flush, batch_size=1)
+        self.assertEquals([page2], self.session.identity_map.dirty)
+
+        # The batch size must make sense
+        self.assertRaises(Exception, self.session.flush, batch_size=0)
+
+
+    def test_autoflush(self):
+        self.client.gremlin.side_effect = [response([11, 12]), response([13, 14, 15]), response([21])]
+        session = Session(client=self.client, metadata=metadata, autoflush_threshold=3)
+        website = Website(name=u'AllRecipes')
+        page = Page(title=u'Page 1')
+        hosts = WebsiteHostsPage(since=2013, outV=website, inV=Page(title=u'Page 2'))
+
+        # Relationships whose endpoints are unknown yet stay pending
+        session.add(hosts)
+        session.add(website)
+        self.assertEquals(0, self.client.gremlin.call_count)
+        session.add(page)
+        self.assertEquals(1, self.client.gremlin.call_count)
+        self.assertEquals([hosts], session._new.values())
+
+        # They are flushed along with their endpoints, but no longer count
+        session.add(hosts.inV)
+        session.add(Page(title=u'Page 3'))
+        self.assertEquals(1, self.client.gremlin.call_count)
+        session.add(Page(title=u'Page 4'))
+        self.assertEquals(3, self.client.gremlin.call_count)
+        self.assertEquals(0, len(session._new))
+        self.assertEquals(21, hosts.id)
+
+
+    def test_autoflush_unresolved(self):
+        session = Session(client=self.client, metadata=metadata, autoflush_threshold=10)
+        session._plan = Mock(wraps=session._plan)
+        for i in xrange(1000):
+            session.add(WebsiteHostsPage(since=2013, outV=Website(), inV=i))
+
+        # Dangling relationships are not planned again on every addition
+        self.assertEquals(0, self.client.gremlin.call_count)
+        self.assertEquals(1000, len(session._new))
+        self.assertEquals(7, session._plan.call_count)
+
+
+    def test_explain_flush(self):
+        self.client.gremlin.side_effect = [response([11, 12]), response([13])]
+        website = Website(name=u'AllRecipes')
+        pages = [Page(title=u'Page 1'), Page(title=u'Page 2')]
+        for obj in [website] + pages:
+            self.session.add(obj)
+
+        # Nothing is sent
+        explanation = self.session.explain_flush()
+        self.assertEquals(0, self.client.gremlin.call_count)
+        self.assertEquals(['Website', 'Page', 'Page'], [insert['model'] for insert in explanation['inserts']])
+        self.assertEquals(2, explanation['requests'])
+
+        # The payload matches what is actually sent
+        self.session.flush()
+        self.assertEquals(explanation['bytes'], sum(
+            len(json.dumps({'script': script, 'params': params}))
+            for (script, params), kwargs in self.client.gremlin.call_args_list
+        ))
+
+        # Updates are described by the properties they change
+        website.name = u'FoodNetwork'
+        pages[0].title = u'Page 1'
+        self.session.delete(pages[1])
+        explanation = self.session.explain_flush()
+        self.assertEquals([{'model': 'Website', 'object': website, 'id': 11, 'changed': ['name']}], explanation['updates'])
+        self.assertEquals([{'model': 'Page', 'object': pages[1], 'id': 13}], explanation['deletes'])
+        self.assertEquals(2, explanation['requests'])
+        self.assertEquals(len(json.dumps({'name': u'FoodNetwork'})) + len(json.dumps({
+            'script': BulkWriter.DELETE, 'params': {'eids': [], 'vids': [13]}
+        })), explanation['bytes'])
+
+
+    def test_flush_workers(self):
+        # The database assigns ids from the content of the elements
+        def gremlin(script, params):
+            if script == BulkWriter.CREATE_VERTICES:
+                return response([len(data.get('name', data.get('title'))) for data in params['datas']])
+            if script == BulkWriter.CREATE_EDGES:
+                return response([edge['outV'] * 100 + edge['inV'] for edge in params['edges']])
+            return response([len(params['eids']) + len(params['vids'])])
+        clients = []
+        def client_factory():
+            client = Mock()
+            client.gremlin.side_effect = gremlin
+            clients.append(client)
+            return client
+
+        def objects():
+            websites = [Website(name=u'W'*i) for i in range(1, 4)]
+            pages = [Page(title=u'P'*i) for i in range(11, 14)]
+            hosts = [WebsiteHostsPage(since=2013, outV=websites[i], inV=pages[i]) for i in range(3)]
+            return websites + pages + hosts
+
+        serial = Session(client=client_factory(), metadata=metadata, chunk_size=2)
+        parallel = Session(client=Mock(), metadata=metadata, chunk_size=2, client_factory=client_factory)
+        serial_objects, parallel_objects = objects(), objects()
+        for obj in serial_objects:
+            serial.add(obj)
+        for obj in parallel_objects:
+            parallel.add(obj)
+        serial.flush()
+        parallel.flush(workers=3)
+
+        # Same outcome as a serial flush
+        self.assertEquals([obj.id for obj in serial_objects], [obj.id for obj in parallel_objects])
+        self.assertEquals([111, 212, 313], [obj.id for obj in parallel_objects[6:]])
+        self.assertEquals(len(serial.identity_map), len(parallel.identity_map))
+
+        # One client per thread, one model per request
+        self.assertEquals(4, len(clients))
+        calls = sum([client.gremlin.call_args_list for client in clients[1:]], [])
+        self.assertEquals(6, len(calls))
+        for (script, params), kwargs in calls:
+            if script == BulkWriter.CREATE_VERTICES:
+                self.assertEquals(1, len(set(data['element_type'] for data in params['datas'])))
+
+        # Updates and deletes are split as well
+        parallel_objects[0].name = u'AllRecipes'
+        parallel.delete(parallel_objects[6])
+        parallel.delete(parallel_objects[3])
+        parallel.flush(workers=2)
+        self.assertEquals(2, parallel.last_deleted_count)
+        self.assertEquals(1, sum(client.update_vertex.call_count for client in clients))
+        self.assertNotIn(parallel_objects[3], parallel.identity_map)
+
+
+    def test_weak_identity_map(self):
+        self.client.gremlin.side_effect = [response([11])]
+        session = Session(client=self.client, metadata=metadata, weak_identity_map=True)
+        session.add(Website(name=u'AllRecipes'))
+        session.flush()
+
+        # The session does not keep flushed objects alive
+        gc.collect()
+        self.assertEquals(0, len(session.identity_map))
+
+
+    def test_flush_new_relationships(self):
+        self.client.gremlin.side_effect = [response([11, 12]), response([21, 22])]
+
+        website = Website(name=u'AllRecipes')
+        page = Page(title=u'Page 1')
+        hosts1 = WebsiteHostsPage(since=2013, outV=website, inV=page)
+        hosts2 = WebsiteHostsPage(since=2012, outV=website, inV=5)
+        self.session.add(hosts1)
+        self.session.add(hosts2)
+        self.session.add(website)
+        self.session.add(page)
+        self.session.flush()
+
+        # Nodes are inserted first, edges are bound to their fresh ids
+        self.assertEquals(2, self.client.gremlin.call_count)
+        script, params = self.client.gremlin.call_args_list[1][0]
+        self.assertEquals(BulkWriter.CREATE_EDGES, script)
+        self.assertEquals([
+            {'outV': 11, 'inV': 12, 'label': 'hosts', 'data': {'since': 2013}},
+            {'outV': 11, 'inV': 5, 'label': 'hosts', 'data': {'since': 2012}},
+        ], params['edges'])
+        self.assertEquals(21, hosts1.id)
+        self.assertEquals(22, hosts2.id)
+        self.assertIn(hosts1, self.session.identity_map)
+
+
+    def test_flush_new_relationships_unpersisted(self):
+        hosts = WebsiteHostsPage(since=2013, outV=Website(), inV=5)
+        self.session.add(hosts)
+        self.assertRaises(Exception, self.session.flush)
+
+
+    def test_identity_map_size_readd(self):
+        self.client.gremlin.side_effect = [response([11]), response([12])]
+        session = Session(client=self.client, metadata=metadata, identity_map_size=1)
+        website = Website(name=u'AllRecipes')
+        session.add(website)
+        session.flush()
+        session.add(Website(name=u'FoodNetwork'))
+        session.flush()
+
+        # Objects still held are not evicted, and are updated when added again
+        gc.collect()
+        self.assertIs(website, session.get_vertex(11)[0])
+        website.name = u'Epicurious'
+        session.add(website)
+        session.flush()
+        self.assertEquals(2, self.client.gremlin.call_count)
+        self.client.update_vertex.assert_called_once_with(11, {'name': u'Epicurious'})
+        self.assertEquals(11, website.id)
+
+        # Objects persisted outside of the session are updated as well
+        self.client.update_vertex.reset_mock()
+        other = Session(client=self.client, metadata=metadata, identity_map_size=1)
+        other.add(website)
+        other.flush()
+        self.assertEquals(2, self.client.gremlin.call_count)
+        self.assertEquals(11, self.client.update_vertex.call_args[0][0])
+        self.assertEquals(u'Epicurious', self.client.update_vertex.call_args[0][1]['name'])
+        self.assertEquals(11, website.id)
+        self.assertIn(website, other.identity_map)
+
+
+    def test_identity_map_size_relationships(self):
+        self.client.gremlin.side_effect = [response([11, 12]), response([21])]
+        session = Session(client=self.client, metadata=metadata, identity_map_size=1)
+        website = Website(name=u'AllRecipes')
+        page = Page(title=u'Page 1')
+        session.add(website)
+        session.add(page)
+        session.add(WebsiteHostsPage(since=2013, outV=website, inV=page))
+
+        # Nothing is evicted while the unit of work runs
+        session.flush()
+        script, params = self.client.gremlin.call_args_list[1][0]
+        self.assertEquals(BulkWriter.CREATE_EDGES, script)
+        self.assertEquals([
+            {'outV': 11, 'inV': 12, 'label': 'hosts', 'data': {'since': 2013}},
+        ], params['edges'])
+        self.assertEquals(1, len(session.identity_map._objects))
+
+
+    def test_readd_deleted(self):
+        self.client.gremlin.side_effect = [response([11]), response([1]), response([12])]
+        website = Website(name=u'AllRecipes')
+        self.session.add(website)
+        self.session.flush()
+        self.session.delete(website)
+        self.session.flush()
+
+        # Deleted objects are not persisted anymore, and are inserted again
+        self.assertIs(None, website.id)
+        self.session.add(website)
+        self.session.flush()
+        script, params = self.client.gremlin.call_args[0]
+        self.assertEquals(BulkWriter.CREATE_VERTICES, script)
+        self.assertEquals(0, self.client.update_vertex.call_count)
+        self.assertEquals(12, website.id)
+        self.assertIs(website, self.session.get_vertex(12)[0])
+
+
+    def test_attach_mapped_id(self):
+        self.client.gremlin.side_effect = [response([11])]
+        website = Website(name=u'AllRecipes')
+        self.session.add(website)
+        self.session.flush()
+
+        # Another object cannot stand for the same element
+        copy = Website(name=u'FoodNetwork')
+        copy.id = 11
+        self.assertRaises(Exception, self.session.add, copy)
+        self.assertIs(website, self.session.get_vertex(11)[0])
+        self.assertNotIn(copy, self.session.identity_map)
+
+
+    def test_flush_mutated(self):
+        self.client.gremlin.return_value = response([
+            {'_id': 11, '_type': 'vertex', 'element_type': 'Recipe', 'title': u'Lasagna', 'tags': [u'pasta']}
+        ])
+        session = Session(client=self.client, metadata=recipe.metadata)
+        lasagna = Query(session, recipe, Recipe).first()
+        self.assertEquals([], session.identity_map.dirty)
+
+        # Values changed in place are flushed, although nothing was assigned
+        lasagna.tags.append(u'italian')
+        session.flush()
+        self.client.update_vertex.assert_called_once_with(11, {'tags': [u'pasta', u'italian']})
+
+        # Once flushed, they are clean again
+        self.client.update_vertex.reset_mock()
+        session.flush()
+        self.assertEquals(0, self.client.update_vertex.call_count)
+        lasagna.tags.remove(u'pasta')
+        session.flush()
+        self.client.update_vertex.assert_called_once_with(11, {'tags': [u'italian']})
@@ -7,6 +7,9 @@
 
 from graphalchemy.tests.abstract import GraphAlchemyTestCase
 
+from mock import Mock
+from graphalchemy.ogm import BulbsObjectManager
+
 from graphalchemy.fixture.model import Recipe
 from graphalchemy.fixture.model import WebsiteHostsPage
 
@@ -84,6 +87,84 @@ class BulbsObjectManagerTestCase(GraphAlchemyTestCase):
         self.assertEquals('Hello2', recipe_titan.title)
 
 
+    def test_add_delete(self):
+        
+        ogm = BulbsObjectManager("http://localhost:8182/graphs/", "graph")
+        recipes = [Recipe(timeTotal=i) for i in range(3)]
+        
+        # Entities are added once, in order
+        for recipe in recipes + recipes:
+            ogm.add(recipe)
+        self.assertEquals(recipes, list(ogm.session_add.itervalues()))
+        
+        # Deleting an entity unschedules its addition
+        ogm.delete(recipes[1])
+        ogm.delete(recipes[1])
+        self.assertEquals([recipes[0], recipes[2]], list(ogm.session_add.itervalues()))
+        self.assertEquals([recipes[1]], list(ogm.session_delete.itervalues()))
+        
+        # And the reverse
+        ogm.add(recipes[1])
+        self.assertEquals([recipes[0], recipes[2], recipes[1]], list(ogm.session_add.itervalues()))
+        self.assertEquals([], list(ogm.session_delete.itervalues()))
+        
+        
+    def test_flush_delete(self):
+        
+        ogm = BulbsObjectManager("http://localhost:8182/graphs/", "graph")
+        ogm.writer = Mock()
+        ogm.writer.delete.return_value = 1
+        
+        recipe = Recipe(ogm.client)
+        recipe.eid = 1
+        hosts = WebsiteHostsPage(ogm.client)
+        hosts.eid = 2
+        unpersisted = Recipe()
+        ogm.delete(recipe)
+        ogm.delete(hosts)
+        ogm.delete(unpersisted)
+        ogm.flush()
+        
+        # Deletions are grouped by type, and sent at once
+        ogm.writer.delete.assert_called_once_with([2], [1])
+        self.assertEquals(1, ogm.last_deleted_count)
+        self.assertEquals([], list(ogm.session_delete.itervalues()))
+        
+        
+    def test_flush_new_relations(self):
+        
+        ogm = BulbsObjectManager("http://localhost:8182/graphs/", "graph")
+        ogm.writer = Mock()
+        ogm.writer.create_edges.return_value = [31, 32]
+        
+        outV = Recipe()
+        outV.eid = 1
+        hosts1 = WebsiteHostsPage(since=2012, accessible=True)
+        hosts1.set_outV(outV)
+        hosts1.set_inV(2)
+        hosts2 = WebsiteHostsPage(since=2013)
+        hosts2.set_outV(3)
+        hosts2.set_inV(4)
+        ogm.add(hosts1)
+        ogm.add(hosts2)
+        ogm.flush()
+        
+        # All the new relations are sent at once
+        self.assertEquals(1, ogm.writer.create_edges.call_count)
+        edges = ogm.writer.create_edges.call_args[0][0]
+        self.assertEquals([(1, 2), (3, 4)], [(edge['outV'], edge['inV']) for edge in edges])
+        self.assertEquals(['hosts', 'hosts'], [edge['label'] for edge in edges])
+        
+        # Relations are initialized as if they were loaded
+        self.assertEquals(31, hosts1.eid)
+        self.assertEquals(1, hosts1._outV)
+        self.assertEquals(2, hosts1._inV)
+        self.assertEquals({u'since': 2012, u'accessible': 1}, hosts1._data)
+        self.assertEquals(32, hosts2.eid)
+        self.assertEquals({u'since': 2013}, hosts2._data)
+        self.assertTrue(hosts2._initialized)
+        
+        
     def test_flush_relation(self):
         
         # Load repository
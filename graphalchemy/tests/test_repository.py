@@ -10,6 +10,7 @@ from graphalchemy.tests.abstract import GraphAlchemyTestCase
 from graphalchemy.repository import BulbsNodeRepository
 from graphalchemy.repository import BulbsRelationshipRepository
 from graphalchemy.metadata import BulbsMetadata
+from graphalchemy.blueprints.predicates import Predicate
 
 from mock import Mock
 from graphalchemy.fixture.model import Website
@@ -144,6 +145,20 @@ class BulbsNodeRepositoryTestCase(GraphAlchemyTestCase):
             {'eid': 123, u'name': 'Foo'}
         ), repository._build_query_filter(eid=123, name='Foo'))
         
+        # Predicates are bound by position
+        self.assertEquals((
+            u'g.V("name", name).has("views", T.gte, q0).interval("created", q1[0], q1[1])',
+            {u'name': 'Foo', u'q0': 10, u'q1': [1, 5]}
+        ), repository._build_query_filter(
+            Predicate('views', 'gte', 10), Predicate('created', 'between', (1, 5)), name='Foo'
+        ))
+        
+        # Keys cannot inject gremlin code
+        evil = 'evil", 1).sideEffect{g.clear()}.has("x'
+        self.assertRaises(Exception, repository._build_query_filter, **{evil: 1})
+        self.assertRaises(Exception, repository._build_query_filter, Predicate(evil, 'lt', 1))
+        self.assertRaises(Exception, repository._build_query_filter, Predicate(evil, 'between', (1, 2)))
+        
 
     def test_create(self):        
         